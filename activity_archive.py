@@ -0,0 +1,188 @@
+"""
+activity_archive.py – Monthly archive segments for activity_log.
+
+activity_log keeps the current month and the HOT_MONTHS before it. Older
+months are moved, one month at a time, into zstd-compressed Parquet files
+(archive/activity-YYYY-MM.parquet) sorted by user and time, so a user's
+rows sit in few row groups. The segments are listed in activity_segments
+(migration 9). A month is read and its file written outside any
+transaction; the write lock is only taken to record the segment, then to
+delete its rows a batch at a time. Archival runs from cron (this
+module) or the admin Export page, never implicitly.
+
+get_activity() reads the hot table through its indexes, plus only the
+segments whose month overlaps the requested range.
+
+    python activity_archive.py            # archive every month past the hot window
+    python activity_archive.py --vacuum   # …then shrink umrah.db
+"""
+
+import os
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+
+import db_utils as db
+from db_pool import get_connection, transaction
+
+ARCHIVE_DIR = os.environ.get("UMRAH_ARCHIVE_DIR", "archive")
+HOT_MONTHS = int(os.environ.get("UMRAH_ACTIVITY_HOT_MONTHS", 3))
+ROW_GROUP_SIZE = 20_000
+DELETE_BATCH = 2_000     # rows per delete transaction
+COMPRESSION = "zstd"
+COLUMNS = ["id", "user_id", "action", "timestamp"]
+
+
+def _add_months(day, n):
+    months = day.year * 12 + day.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def cutoff(today=None):
+    """First day of the oldest month that stays in activity_log."""
+    return _add_months(today or date.today(), -HOT_MONTHS)
+
+
+def _path(name):
+    return os.path.join(ARCHIVE_DIR, name)
+
+
+# ------------------ SEGMENTS ------------------ #
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([("id", pa.int64()), ("user_id", pa.int64()),
+                      ("action", pa.string()), ("timestamp", pa.string())])
+
+
+def _write_segment(df, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    df = df.sort_values(["user_id", "timestamp", "id"], na_position="first")
+    table = pa.Table.from_pandas(df[COLUMNS], schema=_schema(), preserve_index=False)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)  # readers never see a half-written segment
+
+
+def _read_segment(path, user_id=None, lo=None, hi=None):
+    import pyarrow.parquet as pq
+
+    filters = []
+    if user_id is not None:
+        filters.append(("user_id", "=", int(user_id)))
+    if lo is not None:
+        filters.append(("timestamp", ">=", lo))
+    if hi is not None:
+        filters.append(("timestamp", "<", hi))
+    # row-group statistics skip the groups that cannot match
+    return pq.read_table(path, columns=COLUMNS, filters=filters or None).to_pandas()
+
+
+def _archive_month(month):
+    """Move one month (a date on its first day) out of activity_log; returns the rows moved."""
+    lo, hi = f"{month:%Y-%m}-01", f"{_add_months(month, 1):%Y-%m}-01"
+    name = f"activity-{month:%Y-%m}.parquet"
+    # read and write the segment without the write lock: activity_log is
+    # append-only and new rows get higher ids, so between the ids read here
+    # the month has no rows but these when they are deleted below
+    df = pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM activity_log "
+                           "WHERE timestamp >= ? AND timestamp < ?", get_connection(), params=(lo, hi))
+    if df.empty:
+        return 0
+    ids = sorted(df["id"].tolist())
+    if os.path.exists(_path(name)):
+        # a late row for an archived month, or a run that died before its deletes
+        df = pd.concat([_read_segment(_path(name)), df]).drop_duplicates("id", keep="last")
+    _write_segment(df, _path(name))
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO activity_segments (month, file, rows, first_id, last_id, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(month) DO UPDATE SET file = excluded.file, rows = excluded.rows,
+                first_id = excluded.first_id, last_id = excluded.last_id,
+                archived_at = excluded.archived_at""",
+                     (f"{month:%Y-%m}", name, len(df), int(df["id"].min()), int(df["id"].max()),
+                      datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")))
+    # the segment is recorded, so a row still in the table is only a duplicate
+    # until its batch goes; short batches keep the write lock free for others
+    moved = 0
+    for start in range(0, len(ids), DELETE_BATCH):
+        batch = ids[start:start + DELETE_BATCH]
+        with transaction() as conn:
+            moved += conn.execute("DELETE FROM activity_log WHERE id BETWEEN ? AND ? "
+                                  "AND timestamp >= ? AND timestamp < ?",
+                                  (batch[0], batch[-1], lo, hi)).rowcount
+    return moved
+
+
+def archive(today=None):
+    """Archive every month older than cutoff(); returns {month: rows moved}."""
+    keep_from = cutoff(today).isoformat()
+    moved = {}
+    while True:
+        oldest = get_connection().execute(
+            "SELECT MIN(timestamp) FROM activity_log WHERE timestamp < ?", (keep_from,)).fetchone()[0]
+        if oldest is None:
+            return moved
+        month = date(int(oldest[:4]), int(oldest[5:7]), 1)
+        moved[f"{month:%Y-%m}"] = _archive_month(month)
+        if not moved[f"{month:%Y-%m}"]:
+            return moved  # a timestamp outside its month's range: leave it rather than loop
+
+
+def segments(start=None, end=None):
+    """Segment files for the months overlapping [start, end], oldest first."""
+    lo = f"{start}"[:7] if start else "0000-00"
+    hi = f"{end}"[:7] if end else "9999-99"
+    return [_path(name) for (name,) in get_connection().execute(
+        "SELECT file FROM activity_segments WHERE month BETWEEN ? AND ? ORDER BY month", (lo, hi))]
+
+
+# ------------------ QUERIES ------------------ #
+def _bounds(start, end):
+    # same semantics as db_utils._date_range: both ends inclusive, by day
+    lo = str(start) if start is not None else None
+    hi = (date.fromisoformat(str(end)[:10]) + timedelta(days=1)).isoformat() if end is not None else None
+    return lo, hi
+
+
+def get_activity(user_id=None, start=None, end=None):
+    """
+    Activity rows for ``user_id`` (all users when None) between the dates
+    ``start`` and ``end`` (inclusive, open when None), archived and hot,
+    oldest first.
+    """
+    lo, hi = _bounds(start, end)
+    frames = [_read_segment(path, user_id, lo, hi) for path in segments(start, end)]
+    sql, where, params, key = db.activity_query(user_id=user_id, start=start, end=end)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    frames.append(pd.read_sql_query(f"{sql} ORDER BY {key}", get_connection(), params=params))
+    df = pd.concat([f for f in frames if not f.empty] or frames[-1:], ignore_index=True)
+    # an interrupted archive run can leave a row in both places
+    return df.drop_duplicates("id").sort_values(["timestamp", "id"], ignore_index=True)
+
+
+def iter_segments(user_id=None, start=None, end=None, search=None):
+    """The archived rows matching the activity export filters, one month per DataFrame, in id order."""
+    lo, hi = _bounds(start, end)
+    for path in segments(start, end):
+        df = _read_segment(path, user_id, lo, hi)
+        if search:
+            # LIKE semantics: a case-insensitive substring
+            df = df[df["action"].str.contains(search, case=False, regex=False, na=False)]
+        if not df.empty:
+            yield df.sort_values("id", ignore_index=True)
+
+
+if __name__ == "__main__":
+    import sys
+
+    for month, rows in archive().items():
+        print(f"{month}: {rows} rows archived")
+    if "--vacuum" in sys.argv:
+        get_connection().execute("VACUUM")
+        print("vacuumed")
@@ -0,0 +1,355 @@
+"""
+admin_ui.py – Streamlit building blocks shared by the admin screens in
+umrah.py and test.py.
+"""
+
+import os
+import tempfile
+
+import streamlit as st
+import db_utils as db
+import db_fetch
+import db_metrics
+
+BOOKING_STATUSES = ["Pending", "Confirmed", "Cancelled"]
+SUPPORT_STATUSES = ["Pending", "Resolved"]
+MAX_DOWNLOAD_BYTES = int(os.environ.get("UMRAH_MAX_DOWNLOAD_MB", 200)) * 2**20
+
+
+# ───────────────────── LAZY SECTIONS ─────────────────────
+class Loader:
+    """
+    Per-rerun memo of named data dependencies: ``data.trips`` calls the
+    ``trips`` fetcher on first access and reuses the result for the rest of
+    the rerun; ``load()`` fetches several at once, concurrently. Create a
+    new Loader on every rerun.
+    """
+
+    def __init__(self, **fetchers):
+        self._fetchers = fetchers
+        self._values = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self._values:
+            self._values[name] = self._fetchers[name]()
+        return self._values[name]
+
+    def load(self, *names):
+        """Fetch the named dependencies not loaded yet, concurrently."""
+        pending = {name: self._fetchers[name] for name in dict.fromkeys(names)
+                   if name not in self._values}
+        for name, result in db_fetch.fetch(**pending).items():
+            if result.error is None:
+                self._values[name] = result.value
+            # a failed one is fetched again on first access, raising there
+
+
+def sections(key, declared, data):
+    """
+    Draw a section switcher for ``declared`` ({label: dependency names}) and
+    return the active label. Only that section's dependencies are fetched,
+    so a rerun costs what the visible section needs, not the sum of all.
+    """
+    labels = list(declared)
+    active = st.radio(key, labels, horizontal=True, key=f"{key}_section",
+                      label_visibility="collapsed")
+    db_metrics.set_page(active)
+    data.load(*declared[active])
+    return active
+
+
+# ───────────────────── PAGINATION ─────────────────────
+def paged(key, fetch, page_size=db.PAGE_SIZE, **filters):
+    """
+    Fetch and return the current page of ``fetch`` (a db_utils *_page reader)
+    and draw Previous/Next controls under it. The cursor stack lives in
+    session_state and resets whenever the filters change.
+    """
+    state = st.session_state.setdefault(f"{key}_pager", {"filters": None, "cursors": [None]})
+    if state["filters"] != filters:
+        state["filters"], state["cursors"] = filters, [None]
+    cursors = state["cursors"]
+
+    df, next_cursor = fetch(after=cursors[-1], limit=page_size, **filters)
+
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    prev_col.button("◀ Previous", key=f"{key}_prev", disabled=len(cursors) == 1,
+                    on_click=cursors.pop)
+    info_col.caption(f"Page {len(cursors)} · {len(df)} rows")
+    next_col.button("Next ▶", key=f"{key}_next", disabled=next_cursor is None,
+                    on_click=cursors.append, args=(next_cursor,))
+    return df
+
+
+def filter_bar(key, statuses=None, packages=False, dates=True):
+    """Render the common filter widgets and return them as keyword filters."""
+    cols = st.columns(4)
+    filters = {"search": cols[0].text_input("Search", key=f"{key}_q") or None}
+    if statuses:
+        status = cols[1].selectbox("Status", ["All"] + statuses, key=f"{key}_status")
+        filters["status"] = None if status == "All" else status
+    if packages is not False:  # True, or a name -> id lookup the page already loaded
+        names = db.package_ids() if packages is True else packages
+        pkg = cols[2].selectbox("Package", ["All"] + list(names), key=f"{key}_pkg")
+        filters["package_id"] = None if pkg == "All" else names[pkg]
+    if dates:
+        filters["start"] = cols[3].date_input("From", value=None, key=f"{key}_from")
+        filters["end"] = cols[3].date_input("To", value=None, key=f"{key}_to")
+    return filters
+
+
+# ───────────────────── SEARCH ─────────────────────
+def search_panel(key="search"):
+    """Full-text search box over tickets, travellers and packages, ranked by relevance."""
+    cols = st.columns([3, 2])
+    query = cols[0].text_input("Search everything", key=f"{key}_text",
+                               placeholder="issue words, names, passport numbers, emails…")
+    scopes = cols[1].multiselect("In", list(db.SEARCH_SCOPES), default=list(db.SEARCH_SCOPES),
+                                 key=f"{key}_scopes")
+    if not query or not scopes:
+        return
+    state = st.session_state.setdefault(f"{key}_pager", {"query": None, "offset": 0})
+    if state["query"] != (query, scopes):
+        state["query"], state["offset"] = (query, scopes), 0
+    page_size = db.SEARCH_PAGE_SIZE
+    # one extra row tells us whether there is a next page
+    results = db.search(query, scopes, limit=page_size + 1, offset=state["offset"])
+    has_next = len(results) > page_size
+    st.dataframe(results.head(page_size).drop(columns="rank"), hide_index=True,
+                 use_container_width=True)
+
+    def move(step):
+        state["offset"] = max(0, state["offset"] + step)
+
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    prev_col.button("◀ Previous", key=f"{key}_prev", disabled=state["offset"] == 0,
+                    on_click=move, args=(-page_size,))
+    info_col.caption(f"Page {state['offset'] // page_size + 1}")
+    next_col.button("Next ▶", key=f"{key}_next", disabled=not has_next,
+                    on_click=move, args=(page_size,))
+
+
+# ───────────────────── EDITABLE GRID ─────────────────────
+def status_grid(key, df, table, label, statuses, user_id):
+    """
+    Show ``df`` as an editable grid whose only editable cells are ``status``
+    and a ``select`` tick box. Saving writes just the cells that changed
+    (st.data_editor's edited_rows), and a bulk action sets every ticked row
+    to one status; each is one transaction with one batched audit entry set.
+    """
+    saved = st.session_state.pop(f"{key}_saved", None)
+    if saved:
+        st.success(f"{saved} {label}(s) updated.")
+    version = st.session_state.setdefault(f"{key}_grid_version", 0)
+    ids = tuple(int(i) for i in df["id"])
+    # edited_rows are row positions: a new page or filter result gets a fresh
+    # editor, so unsaved edits never carry over onto the rows that moved in
+    editor_key = f"{key}_grid_{version}_{hash(ids):x}"
+    grid = df.assign(select=False)
+    st.data_editor(
+        grid, key=editor_key, hide_index=True, use_container_width=True,
+        disabled=[c for c in grid.columns if c not in ("status", "select")],
+        column_config={
+            "select": st.column_config.CheckboxColumn("✓", width="small"),
+            "status": st.column_config.SelectboxColumn("Status", options=statuses, required=True),
+        },
+    )
+    changed, selected = _grid_edits(editor_key, ids)
+
+    save_col, status_col, bulk_col = st.columns([2, 2, 2])
+    save_col.button(f"Save {len(changed)} change(s)", key=f"{key}_save", disabled=not changed,
+                    on_click=_save_statuses, args=(key, table, label, editor_key, ids, user_id))
+    bulk_status = status_col.selectbox("Set selected to", statuses, key=f"{key}_bulk_status",
+                                       label_visibility="collapsed")
+    bulk_col.button(f"Set {len(selected)} selected to {bulk_status}", key=f"{key}_bulk",
+                    disabled=not selected, on_click=_save_statuses,
+                    args=(key, table, label, editor_key, ids, user_id, True))
+
+
+def _grid_edits(editor_key, ids):
+    """({id: new status}, [ticked ids]) from the editor's edited_rows, mapped onto ``ids``."""
+    edits = st.session_state.get(editor_key, {}).get("edited_rows", {})
+    edits = {int(pos): cells for pos, cells in edits.items() if int(pos) < len(ids)}
+    return ({ids[pos]: cells["status"] for pos, cells in edits.items() if "status" in cells},
+            [ids[pos] for pos, cells in edits.items() if cells.get("select")])
+
+
+def _save_statuses(key, table, label, editor_key, ids, user_id, bulk=False):
+    # re-read the edits against the ids this editor was drawn with
+    changed, selected = _grid_edits(editor_key, ids)
+    if bulk:
+        changed = dict.fromkeys(selected, st.session_state[f"{key}_bulk_status"])
+    if not changed:
+        return
+    update_many = {"bookings": db.update_booking_statuses,
+                   "support_requests": db.update_support_statuses}[table]
+    by_status = {}
+    for row_id, status in changed.items():
+        by_status.setdefault(status, []).append(row_id)
+    with db.transaction():
+        for status, ids in by_status.items():
+            update_many(ids, status)
+        db.log_activities(user_id, [f"Updated {label} {row_id} to {status}"
+                                    for row_id, status in changed.items()])
+    st.session_state[f"{key}_grid_version"] += 1  # fresh editor, edits applied
+    st.session_state[f"{key}_saved"] = len(changed)
+
+
+# ───────────────────── BULK IMPORT ─────────────────────
+def import_panel(user_id):
+    import bulk_import
+    import pandas as pd
+
+    st.subheader("Bulk Import")
+    entity = st.selectbox("Import into", list(bulk_import.ENTITIES), key="import_entity")
+    spec = bulk_import.ENTITIES[entity]
+    st.caption(f"Required columns: {', '.join(spec['required'])}. "
+               f"Optional: {', '.join(spec['optional'])}.")
+    upload = st.file_uploader("CSV or Excel file", type=["csv", "xlsx"], key="import_file")
+    if upload is not None and st.button("Import", key="import_run"):
+        defaults = {"handled_by": user_id} if entity == "travellers" else {}
+        try:
+            report = bulk_import.import_file(entity, upload, defaults=defaults)
+        except ValueError as exc:
+            st.error(str(exc))
+            return
+        st.success(f"Imported {report['inserted']} {entity}.")
+        if report["errors"]:
+            st.warning(f"{len(report['errors'])} row(s) skipped.")
+            st.dataframe(pd.DataFrame(report["errors"], columns=["row", "error"]))
+
+
+# ───────────────────── EXPORT ─────────────────────
+def export_panel(user_id):
+    import bulk_export
+
+    st.subheader("Export")
+    entity = st.selectbox("Export", list(bulk_export.EXPORTS), key="export_entity")
+    fmt = st.radio("Format", bulk_export.FORMATS, horizontal=True, key="export_fmt")
+    statuses = {"bookings": BOOKING_STATUSES, "support": SUPPORT_STATUSES}.get(entity)
+    filters = filter_bar(f"export_{entity}", statuses=statuses, packages=entity == "bookings")
+    if st.button("Prepare export", key="export_run"):
+        # rows are streamed chunk by chunk into a temp file, so building the
+        # export is bounded by the chunk size; st.download_button then holds
+        # the finished file in memory, hence MAX_DOWNLOAD_BYTES
+        with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as out:
+            path = out.name
+        try:
+            rows = bulk_export.export(entity, path, fmt=fmt, **filters)
+            size = os.path.getsize(path)
+            if size > MAX_DOWNLOAD_BYTES:
+                st.error(f"The export is {size / 2**20:.0f} MiB, over the "
+                         f"{MAX_DOWNLOAD_BYTES / 2**20:.0f} MiB download limit; narrow the filters.")
+            else:
+                st.success(f"{rows} rows exported.")
+                with open(path, "rb") as data:
+                    st.download_button("Download", data.read(), file_name=f"{entity}.{fmt}",
+                                       key="export_download")
+        finally:
+            os.unlink(path)
+    if entity == "activity":
+        _archive_action(user_id)
+
+
+def _archive_action(user_id):
+    import activity_archive
+
+    keep_from = activity_archive.cutoff()
+    st.caption(f"Months before {keep_from:%Y-%m} can move to compressed archive segments; "
+               "exports and activity reads still include them.")
+    if st.button(f"Archive activity before {keep_from:%Y-%m}", key="archive_run"):
+        moved = activity_archive.archive()
+        db.log_activity(user_id, f"Archived {sum(moved.values())} activity rows")
+        st.success(f"{sum(moved.values())} rows archived from {len(moved)} month(s).")
+
+
+# ───────────────────── REPORTS ─────────────────────
+def reports_panel():
+    """Revenue, occupancy, booking funnel and payment mix from the analytics summaries."""
+    import analytics
+
+    st.subheader("Reports")
+    recomputed = analytics.refresh()  # only the months that changed since the last view
+    months = analytics.months()
+    if not months:
+        st.info("No bookings or trips to report on yet.")
+        return
+    start, end = st.select_slider("Departure months", months, value=(months[max(0, len(months) - 12)],
+                                                                     months[-1]), key="reports_months")
+    st.caption(f"Summaries as of {analytics.last_refreshed()} UTC"
+               + (f" · {len(recomputed)} month(s) just recomputed" if recomputed else ""))
+
+    revenue, occupancy, funnel, payments = st.tabs(["Revenue", "Occupancy", "Funnel", "Payment mix"])
+    with revenue:
+        df = analytics.revenue(start, end)
+        total, pipeline = st.columns(2)
+        total.metric("Confirmed revenue", f"{df['revenue'].sum():,.0f}")
+        pipeline.metric("Pending pipeline", f"{df['pipeline'].sum():,.0f}")
+        st.bar_chart(df.groupby("month")[["revenue", "pipeline"]].sum())
+        st.dataframe(df.pivot_table(index="package", columns="month", values="revenue",
+                                    aggfunc="sum", fill_value=0), use_container_width=True)
+    with occupancy:
+        trips = analytics.occupancy_by_trip(start, end)
+        st.metric("Average trip occupancy", f"{trips['occupancy'].mean():.0%}" if len(trips) else "–")
+        st.dataframe(trips, hide_index=True, use_container_width=True,
+                     column_config={"occupancy": st.column_config.NumberColumn(format="%.2f")})
+        st.markdown("**Per bus**")
+        st.dataframe(analytics.occupancy_by_bus(start, end), hide_index=True, use_container_width=True,
+                     column_config={"occupancy": st.column_config.NumberColumn(format="%.2f")})
+    with funnel:
+        st.dataframe(analytics.funnel(start, end), hide_index=True, use_container_width=True)
+    with payments:
+        mix = analytics.payment_mix(start, end)
+        st.bar_chart(mix.pivot_table(index="month", columns="payment_method", values="bookings",
+                                     aggfunc="sum", fill_value=0))
+        st.dataframe(mix, hide_index=True, use_container_width=True)
+
+
+# ───────────────────── PERFORMANCE ─────────────────────
+def performance_panel():
+    """Per-rerun query totals, the rolling latency histogram and the slow-query log."""
+    import pandas as pd
+
+    st.subheader("Performance")
+    on = st.toggle("Record query metrics", value=db_metrics.enabled, key="perf_enabled",
+                   help="Times every statement on this server process. Off: near-zero overhead.")
+    if on != db_metrics.enabled:
+        db_metrics.enable(on)
+    if st.button("Reset", key="perf_reset"):
+        db_metrics.metrics.reset()
+    runs = db_metrics.metrics.runs()
+    if not runs:
+        st.info("No reruns recorded yet." if on else "Metrics are off.")
+        return
+
+    st.caption("Most recent reruns (the first row is still running).")
+    st.dataframe(pd.DataFrame([{
+        "run": r["run"], "page": r["label"],
+        "started": pd.Timestamp(r["started"], unit="s").strftime("%H:%M:%S"),
+        "statements": r["statements"], "rows": r["rows"],
+        "query ms": round(r["query_ms"], 1), "dataframe ms": round(r["frame_ms"], 1),
+    } for r in runs]), hide_index=True, use_container_width=True)
+
+    run = st.selectbox("Break down run", runs, index=min(1, len(runs) - 1), key="perf_run",
+                       format_func=lambda r: f"#{r['run']} {r['label']}")
+    by_helper, by_scope = st.columns(2)
+    for col, group, title in ((by_helper, "by_helper", "helper"), (by_scope, "by_scope", "section")):
+        rows = [{title: name or "(page)", **totals} for name, totals in run[group].items()]
+        if rows:
+            col.dataframe(pd.DataFrame(rows).sort_values("ms", ascending=False).round({"ms": 2}),
+                          hide_index=True, use_container_width=True)
+
+    st.markdown("**Latency histogram** (recent statements, per helper)")
+    st.dataframe(pd.DataFrame(db_metrics.metrics.histogram()).round({"total_ms": 1}),
+                 hide_index=True, use_container_width=True)
+
+    slow = db_metrics.metrics.slow_queries()
+    st.markdown(f"**Slow queries** (≥ {db_metrics.SLOW_MS:g} ms): {len(slow)}")
+    for record in slow[:20]:
+        with st.expander(f"{record['ms']:.0f} ms · {record['rows']} rows · {record['helper']}"
+                         f"{' · ' + record['scope'] if record['scope'] else ''}"):
+            st.code(record["sql"], language="sql")
+            if record["plan"]:
+                st.code(record["plan"], language="text")
@@ -0,0 +1,232 @@
+"""
+analytics.py – Revenue, occupancy, funnel and payment-mix reports.
+
+The figures live in summary tables (migration 8), one set of rows per
+departure month. refresh() recomputes only the months that changed: those
+of bookings past the high-water mark on bookings.created_at (or id, which
+also catches rows imported with an older timestamp) plus the months the
+analytics triggers queued in analytics_stale after an edit. Each month is
+recomputed from scratch with SQL aggregates, so a refresh is idempotent and
+the readers below only touch the small summary tables; derived ratios are
+added with vectorized pandas.
+
+    python db_migrations.py --verify-analytics   # compare with a recompute
+    python db_migrations.py --rebuild-analytics  # recompute every month
+"""
+
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from db_pool import get_connection, transaction
+
+# A booking is priced at its departure's trip price, falling back to the
+# package price when no trip matches (e.g. bookings made before trips existed).
+_PRICED = """
+    WITH priced AS (
+        SELECT substr(b.travel_date, 1, 7) AS month, b.package_id, b.status, b.payment_method,
+               COALESCE((SELECT t.price FROM trips t
+                         WHERE t.trip_date = b.travel_date AND t.package_id = b.package_id
+                         ORDER BY t.id LIMIT 1), p.price, 0) AS price
+        FROM bookings b
+        LEFT JOIN packages p ON p.id = b.package_id
+        WHERE b.travel_date >= ? AND b.travel_date < ?)"""
+
+# table -> (columns, SELECT over the departure dates in [?, ?))
+SUMMARIES = {
+    "revenue_monthly": (
+        ["month", "package_id", "bookings", "confirmed", "revenue", "pipeline"],
+        f"""{_PRICED}
+        SELECT month, package_id, SUM(status IS NOT 'Cancelled'), SUM(status = 'Confirmed'),
+               TOTAL(CASE WHEN status = 'Confirmed' THEN price END),
+               TOTAL(CASE WHEN status = 'Pending' THEN price END)
+        FROM priced GROUP BY month, package_id"""),
+    "booking_funnel": (
+        ["month", "status", "n"],
+        """SELECT substr(travel_date, 1, 7), status, COUNT(*) FROM bookings
+           WHERE travel_date >= ? AND travel_date < ? GROUP BY 1, 2"""),
+    "payment_mix": (
+        ["month", "payment_method", "bookings", "revenue"],
+        f"""{_PRICED}
+        SELECT month, payment_method, SUM(status IS NOT 'Cancelled'),
+               TOTAL(CASE WHEN status = 'Confirmed' THEN price END)
+        FROM priced GROUP BY month, payment_method"""),
+    # booked counts the departure's bookings, seated or not, like get_trips_between
+    "trip_occupancy": (
+        ["trip_id", "month", "package_id", "trip_date", "buses", "capacity", "booked"],
+        """SELECT t.id, substr(t.trip_date, 1, 7), t.package_id, t.trip_date,
+                  (SELECT COUNT(*) FROM buses b WHERE b.trip_id = t.id),
+                  (SELECT COALESCE(SUM(b.capacity), 0) FROM buses b WHERE b.trip_id = t.id),
+                  (SELECT COUNT(*) FROM bookings k
+                   WHERE k.package_id = t.package_id AND k.travel_date = t.trip_date
+                     AND k.status != 'Cancelled')
+           FROM trips t WHERE t.trip_date >= ? AND t.trip_date < ?"""),
+    "bus_occupancy": (
+        ["bus_id", "trip_id", "month", "capacity", "seats"],
+        """SELECT b.id, b.trip_id, substr(t.trip_date, 1, 7), b.capacity, COALESCE(l.seats, 0)
+           FROM trips t
+           JOIN buses b ON b.trip_id = t.id
+           LEFT JOIN bus_load l ON l.bus_id = b.id
+           WHERE t.trip_date >= ? AND t.trip_date < ?"""),
+}
+
+
+def _month_range(month):
+    """[first day, first day of the next month) of ``month`` as date strings."""
+    year, mon = map(int, month.split("-"))
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{month}-01", f"{year:04d}-{mon:02d}-01"
+
+
+# ------------------ REFRESH ------------------ #
+def _watermark(conn):
+    row = conn.execute("SELECT created_at, last_id FROM analytics_watermark WHERE source = 'bookings'").fetchone()
+    return row or (None, None)
+
+
+def _pending(conn):
+    """Months to recompute, and the new high-water mark (None when unchanged)."""
+    created_at, last_id = _watermark(conn)
+    if last_id is None:
+        # first refresh: every month with a booking or a trip
+        months = {m for (m,) in conn.execute(
+            "SELECT DISTINCT substr(travel_date, 1, 7) FROM bookings "
+            "UNION SELECT DISTINCT substr(trip_date, 1, 7) FROM trips") if m}
+        mark = conn.execute("SELECT MAX(created_at), MAX(id) FROM bookings").fetchone()
+        return months, mark
+    newer = "created_at > ? OR id > ?"
+    params = (created_at or "", last_id)
+    months = {m for (m,) in conn.execute(
+        f"SELECT DISTINCT substr(travel_date, 1, 7) FROM bookings WHERE {newer}", params) if m}
+    months |= {m for (m,) in conn.execute("SELECT month FROM analytics_stale")}
+    mark = conn.execute(f"SELECT MAX(created_at), MAX(id) FROM bookings WHERE {newer}", params).fetchone()
+    if mark[1] is None:
+        return months, None
+    # an imported row can be newer by id but older by timestamp
+    return months, (max(mark[0] or "", created_at or ""), max(mark[1], last_id))
+
+
+def _recompute(conn, month):
+    lo, hi = _month_range(month)
+    for table, (columns, select) in SUMMARIES.items():
+        conn.execute(f"DELETE FROM {table} WHERE month = ?", (month,))
+        # REPLACE: a trip or bus that moved month is still filed under the old one
+        conn.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) {select}", (lo, hi))
+
+
+def refresh():
+    """Bring the summaries up to date; returns the months recomputed."""
+    if not _pending(get_connection())[0]:
+        return []  # the common case, without taking the write lock
+    with transaction() as conn:
+        months, mark = _pending(conn)
+        for month in sorted(months):
+            _recompute(conn, month)
+        conn.execute("DELETE FROM analytics_stale")
+        if mark is not None:
+            conn.execute("""
+                INSERT INTO analytics_watermark (source, created_at, last_id, refreshed_at)
+                VALUES ('bookings', ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET created_at = excluded.created_at,
+                    last_id = excluded.last_id, refreshed_at = excluded.refreshed_at""",
+                         (mark[0], mark[1] or 0,
+                          datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")))
+    return sorted(months)
+
+
+def rebuild():
+    """Drop every summary row and the high-water mark, then refresh from scratch."""
+    with transaction() as conn:
+        for table in SUMMARIES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM analytics_watermark")
+        conn.execute("DELETE FROM analytics_stale")
+        return refresh()
+
+
+def verify():
+    """
+    Compare every summary table with a full recompute. Returns {table:
+    (missing or outdated rows, stale rows)} for the tables that differ;
+    run refresh() first, or pending months show up as drift.
+    """
+    conn = get_connection()
+    drift = {}
+    for table, (columns, select) in SUMMARIES.items():
+        stored = {_rounded(r) for r in conn.execute(f"SELECT {', '.join(columns)} FROM {table}")}
+        # the bounds must not look numeric: DATE columns would coerce them
+        actual = {_rounded(r) for r in conn.execute(select, ("0000-00-00", "9999-99-99"))}
+        if stored != actual:
+            drift[table] = (sorted(actual - stored, key=str), sorted(stored - actual, key=str))
+    return drift
+
+
+def _rounded(row):
+    # sums accumulate in a different order over one month than over all
+    return tuple(round(v, 2) if isinstance(v, float) else v for v in row)
+
+
+def last_refreshed():
+    row = get_connection().execute(
+        "SELECT refreshed_at FROM analytics_watermark WHERE source = 'bookings'").fetchone()
+    return row[0] if row else None
+
+
+# ------------------ REPORTS ------------------ #
+def _read(sql, start, end):
+    return pd.read_sql_query(sql, get_connection(), params=(start or "0000-00", end or "9999-99"))
+
+
+def months():
+    """Every month with summarised bookings or trips, oldest first."""
+    return [m for (m,) in get_connection().execute(
+        "SELECT month FROM booking_funnel UNION SELECT month FROM trip_occupancy ORDER BY 1") if m]
+
+
+def revenue(start=None, end=None):
+    """Revenue per package and month for months ``start``..``end`` (YYYY-MM, inclusive)."""
+    return _read("""
+        SELECT r.month, COALESCE(p.name, '(deleted)') AS package, r.bookings, r.confirmed,
+               r.revenue, r.pipeline
+        FROM revenue_monthly r LEFT JOIN packages p ON p.id = r.package_id
+        WHERE r.month BETWEEN ? AND ? ORDER BY r.month, package""", start, end)
+
+
+def occupancy_by_trip(start=None, end=None):
+    df = _read("""
+        SELECT o.trip_id, o.trip_date, COALESCE(p.name, '(deleted)') AS package, o.buses,
+               o.capacity, o.booked
+        FROM trip_occupancy o LEFT JOIN packages p ON p.id = o.package_id
+        WHERE o.month BETWEEN ? AND ? ORDER BY o.trip_date, o.trip_id""", start, end)
+    df["occupancy"] = df["booked"] / df["capacity"].where(df["capacity"] > 0)
+    return df
+
+
+def occupancy_by_bus(start=None, end=None):
+    df = _read("""
+        SELECT o.bus_id, bu.bus_number, o.trip_id, t.trip_date, o.capacity, o.seats
+        FROM bus_occupancy o
+        LEFT JOIN buses bu ON bu.id = o.bus_id
+        LEFT JOIN trips t ON t.id = o.trip_id
+        WHERE o.month BETWEEN ? AND ? ORDER BY t.trip_date, o.bus_id""", start, end)
+    df["occupancy"] = df["seats"] / df["capacity"].where(df["capacity"] > 0)
+    return df
+
+
+def funnel(start=None, end=None):
+    """Bookings per status and month, with the share that got confirmed."""
+    df = _read("SELECT month, status, n FROM booking_funnel WHERE month BETWEEN ? AND ?", start, end)
+    table = df.pivot_table(index="month", columns="status", values="n", aggfunc="sum", fill_value=0)
+    table["total"] = table.sum(axis=1)
+    if "Confirmed" in table:
+        table["confirmed share"] = table["Confirmed"] / table["total"]
+    return table.reset_index()
+
+
+def payment_mix(start=None, end=None):
+    """Bookings and revenue per payment method and month, with each method's share of the month."""
+    df = _read("""
+        SELECT month, COALESCE(payment_method, '(none)') AS payment_method, bookings, revenue
+        FROM payment_mix WHERE month BETWEEN ? AND ? ORDER BY month, payment_method""", start, end)
+    df["share"] = df["bookings"] / df.groupby("month")["bookings"].transform("sum").where(lambda n: n > 0)
+    return df
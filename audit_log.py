@@ -0,0 +1,123 @@
+"""
+audit_log.py – Write-behind queue for activity_log.
+
+log_activity() only enqueues the event; a background thread drains the queue
+and inserts events with executemany, one transaction per batch. A batch is
+written when it reaches BATCH_SIZE events or FLUSH_INTERVAL seconds after its
+first event, whichever comes first. Events logged inside an open
+db_pool.transaction() are written inline as part of it. Set
+UMRAH_AUDIT_SYNC=1 (or ``writer.synchronous = True``) to always write inline,
+e.g. in tests.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from db_pool import in_transaction, transaction
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5   # seconds
+MAX_QUEUE = 10000
+PUT_TIMEOUT = 1.0      # how long a caller waits on a full queue
+
+log = logging.getLogger(__name__)
+
+
+def _utc_timestamp():
+    # same format as CURRENT_TIMESTAMP, captured when the event happened
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class AuditLogWriter:
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_queue=MAX_QUEUE, synchronous=False):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def log(self, user_id, action):
+        self.log_many([(user_id, action)])
+
+    def log_many(self, entries):
+        """Log several (user_id, action) pairs; inline writes use one executemany."""
+        timestamp = _utc_timestamp()
+        events = [(user_id, action, timestamp) for user_id, action in entries]
+        if self.synchronous or in_transaction():
+            # inside a unit of work the events commit (or roll back) with it
+            self._write(events)
+            return
+        for event in events:
+            self._enqueue(event)
+
+    def flush(self):
+        """Block until every queued event has been committed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _enqueue(self, event):
+        self._ensure_started()
+        try:
+            self._queue.put(event, timeout=PUT_TIMEOUT)
+        except queue.Full:
+            # backpressure: rather than drop audit events, pay for the write here
+            self._write([event])
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._stopping.clear()
+                    self._thread = threading.Thread(target=self._run, name="audit-log-writer",
+                                                    daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                log.exception("failed to write %d activity_log events", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _write(events):
+        with transaction() as conn:
+            conn.executemany("INSERT INTO activity_log (user_id, action, timestamp) VALUES (?, ?, ?)",
+                             events)
+
+
+writer = AuditLogWriter(synchronous=os.environ.get("UMRAH_AUDIT_SYNC") == "1")
+atexit.register(writer.close)
@@ -1,12 +1,85 @@
+"""
+auth.py – Login, registration and the session helpers.
+
+Passwords are hashed and checked by passwords.py on its worker pool; a
+legacy or under-cost hash is replaced on the next successful login. User
+rows are looked up through a small TTL cache keyed by email, so repeated
+attempts at shift change do not each go to the database.
+"""
+
+from typing import NamedTuple
+
 import streamlit as st
-import sqlite3
-from hashlib import sha256
+from db_cache import QueryCache, register
+from db_pool import call_after_commit, get_connection, in_transaction, transaction
+from passwords import burn, hash_password, verify_password
+
+USER_CACHE_SIZE = 512
+USER_CACHE_TTL = 60  # seconds; bounds how long another process's edit can go unseen
+
+# registered, so db_utils writes to users (update_row, delete_row) evict it
+user_cache = register(QueryCache(max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL))
+
 
-def get_connection():
-    return sqlite3.connect("umrah.db")
+class User(NamedTuple):
+    id: int
+    password_hash: str
+    role_id: int
+    name: str
 
-def hash_password(password):
-    return sha256(password.encode()).hexdigest()
+
+def get_user(email):
+    """The users row for ``email`` or None, through the TTL cache."""
+    user = user_cache.get(email)
+    if user is None:
+        generation = user_cache.generation(("users",))
+        row = get_connection().execute(
+            "SELECT id, password_hash, role_id, name FROM users WHERE email=?", (email,)).fetchone()
+        if row is None:
+            return None  # misses are not cached: the account may be registered next
+        user = User._make(row)
+        if not in_transaction():
+            user_cache.put(email, ("users",), user, generation)
+    return user
+
+def authenticate(email, password):
+    """The User for valid credentials, else None."""
+    user = get_user(email)
+    if user is None:
+        burn(password)
+        return None
+    ok, rehash = verify_password(password, user.password_hash)
+    if not ok:
+        return None
+    if rehash:
+        user = _rehash(email, user, password)
+    return user
+
+def _rehash(email, user, password):
+    new_hash = hash_password(password)  # before taking the write lock
+    with transaction() as conn:
+        # compare-and-set: a concurrent login or password change wins
+        changed = conn.execute("UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                               (new_hash, user.id, user.password_hash)).rowcount
+        if changed:
+            user = user._replace(password_hash=new_hash)
+            call_after_commit(lambda: user_cache.put(email, ("users",), user))
+        else:
+            call_after_commit(lambda: user_cache.invalidate("users"))
+    return user
+
+def register_user(name, passport, nationality, email, phone, password, role_id=2):
+    """Create an account; False when the email or passport number is taken."""
+    password_hash = hash_password(password)
+    with transaction() as conn:
+        if conn.execute("SELECT 1 FROM users WHERE email=? OR passport_number=?",
+                        (email, passport)).fetchone():
+            return False
+        conn.execute('''INSERT INTO users
+                        (name, passport_number, nationality, email, phone, password_hash, role_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     (name, passport, nationality, email, phone, password_hash, role_id))
+    return True
 
 def login_form():
     #st.session_state.show_register = False
@@ -15,16 +88,12 @@ def login_form():
     email = st.text_input("Email", key="login_email")
     password = st.text_input("Password", type="password", key="login_pass")
     if st.button("Login"):
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("SELECT id, password_hash, role_id, name FROM users WHERE email=?", (email,))
-        user = c.fetchone()
-        conn.close()
-        if user and user[1] == hash_password(password):
+        user = authenticate(email, password)
+        if user:
             st.session_state.logged_in = True
-            st.session_state.user_id = user[0]
-            st.session_state.role_id = user[2]
-            st.session_state.user_name = user[3]
+            st.session_state.user_id = user.id
+            st.session_state.role_id = user.role_id
+            st.session_state.user_name = user.name
         else:
             st.error("Invalid login credentials.")
 
@@ -38,20 +107,11 @@ def registration_form():
     phone = st.text_input("Phone", key="reg_phone")
     password = st.text_input("Password", type="password", key="reg_password")
     if st.button("Register"):
-        conn = get_connection()
-        c = conn.cursor()
-        try:
-            c.execute('''INSERT INTO users 
-                         (name, passport_number, nationality, email, phone, password_hash, role_id) 
-                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                      (name, passport, nationality, email, phone, hash_password(password), 2))
-            conn.commit()
+        if register_user(name, passport, nationality, email, phone, password):
             st.success("Registration successful. You can now log in.")
             st.session_state.show_register = False
-        except sqlite3.IntegrityError:
+        else:
             st.error("Email or passport number already exists.")
-        finally:
-            conn.close()
 
 def logout():
     st.session_state.clear()
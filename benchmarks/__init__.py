@@ -0,0 +1,13 @@
+"""
+benchmarks – Synthetic-data benchmarks for db_utils and the Streamlit pages.
+
+    python -m benchmarks --bookings 100000                 # generate + run
+    python -m benchmarks --bookings 100000 --out run.json  # save results
+    python -m benchmarks --bookings 100000 --baseline run.json  # compare
+
+datagen builds a seeded database of the requested size (cached in the temp
+dir, so reruns skip generation); harness times every public db_utils
+function and full AppTest reruns of umrah.py and test.py, reporting
+p50/p95 latency and peak Python memory per case, plus the login
+throughput of --sessions concurrent sessions (auth.login_burst).
+"""
@@ -0,0 +1,92 @@
+"""
+python -m benchmarks – generate (or reuse) a synthetic database and run the
+harness against it. Exits 1 when --baseline is given and anything regressed.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark db_utils and the Streamlit pages.")
+    parser.add_argument("--bookings", type=int, default=10_000,
+                        help="database size in bookings (1k-1M); other tables scale with it")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="database file (default: cached per size/seed in the temp dir)")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the database even if cached")
+    parser.add_argument("--repeat", type=int, default=None, help="timed runs per case")
+    parser.add_argument("--budget", type=float, default=None, help="max seconds per case")
+    parser.add_argument("--only", action="append", help="run only cases whose name contains this")
+    parser.add_argument("--no-apps", action="store_true", help="skip the AppTest page runs")
+    parser.add_argument("--sessions", type=int, default=None,
+                        help="concurrent sessions in the auth.login_burst case")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a previous --out file")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="allowed relative growth before a case counts as regressed")
+    args = parser.parse_args(argv)
+
+    path = args.db or os.path.join(tempfile.gettempdir(), f"umrah-bench-{args.bookings}-s{args.seed}.db")
+    # the benchmark writes to its database, so work on a copy of the cache
+    # entry rather than the pristine one
+    from benchmarks import datagen
+    if args.regenerate or not os.path.exists(path):
+        print(f"generating {args.bookings} bookings into {path} …")
+        datagen.generate(path, args.bookings, args.seed)
+    work = path + ".run"
+    _copy(path, work)
+
+    # db_pool reads these at import time
+    os.environ["UMRAH_DB"] = work
+    os.environ.setdefault("UMRAH_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "umrah-bench-upload"))
+    if "UMRAH_ARCHIVE_DIR" not in os.environ:
+        # segments belong to the copy, so start from none like the copy does
+        shutil.rmtree(work + "-archive", ignore_errors=True)
+        os.environ["UMRAH_ARCHIVE_DIR"] = work + "-archive"
+    from benchmarks import harness
+    if args.sessions:
+        harness.LOGIN_SESSIONS = args.sessions
+
+    options = {k: v for k, v in (("repeat", args.repeat), ("budget_s", args.budget)) if v is not None}
+    report = harness.run(only=args.only, include_apps=not args.no_apps, seed=args.seed, **options)
+    report["meta"]["db"] = path
+    if report["uncovered"]:
+        print(f"no benchmark case for: {', '.join(report['uncovered'])}")
+    if args.out:
+        harness.save(report, args.out)
+        print(f"results written to {args.out}")
+
+    failed = bool(report["errors"])
+    if args.baseline:
+        baseline = harness.load(args.baseline)
+        if baseline["meta"].get("bookings") != report["meta"]["bookings"]:
+            print(f"warning: baseline has {baseline['meta'].get('bookings')} bookings, "
+                  f"this run {report['meta']['bookings']}")
+        tolerance = harness.TOLERANCE if args.tolerance is None else args.tolerance
+        regressions = harness.compare(report, baseline, tolerance)
+        for name, metric, before, after in regressions:
+            print(f"REGRESSION {name} {metric}: {before} -> {after} ({after / before - 1:+.0%})"
+                  if before else f"REGRESSION {name} {metric}: {before} -> {after}")
+        print("no regressions" if not regressions else f"{len(regressions)} regression(s)")
+        failed |= bool(regressions)
+    return 1 if failed else 0
+
+
+def _copy(src, dst):
+    import sqlite3
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(dst + suffix):
+            os.remove(dst + suffix)
+    with sqlite3.connect(src) as source, sqlite3.connect(dst) as target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
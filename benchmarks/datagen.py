@@ -0,0 +1,194 @@
+"""
+datagen.py – Seeded synthetic umrah.db of a given size.
+
+Every table is scaled from the number of bookings (see sizes()). Rows are
+bulk-loaded before the trigger migrations are applied; those migrations
+backfill the stats counters, bus_load, booking_view and the FTS indexes
+from what is already there, so the result is the same as if the rows had
+been inserted through the app, just much faster to build.
+"""
+
+import os
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import db_migrations
+import passwords
+
+CHUNK_ROWS = 50_000
+BASE_SCHEMA = 2          # schema + indexes, no triggers yet
+PASSWORD = "bench"       # every generated account logs in with this
+ADMIN_EMAIL = "admin@bench.test"
+
+STATUSES = (("Pending", 3), ("Confirmed", 6), ("Cancelled", 1))
+PAYMENTS = ("Credit Card", "Bank Transfer", "Cash")
+CITIES = ("Makkah", "Madinah", "Jeddah")
+NATIONALITIES = ("SA", "EG", "PK", "ID", "MY", "TR", "GB", "US", "NG", "BD")
+FIRST = ("Ahmed", "Fatima", "Omar", "Aisha", "Yusuf", "Maryam", "Ali", "Khadija",
+         "Hassan", "Zainab", "Ibrahim", "Amina", "Bilal", "Huda", "Tariq", "Salma")
+LAST = ("Khan", "Rahman", "Hussain", "Ali", "Siddiqui", "Malik", "Hassan", "Abdullah",
+        "Yilmaz", "Osman", "Farouk", "Nasser", "Qureshi", "Iqbal", "Saleh", "Karim")
+ISSUES = ("visa", "refund", "hotel", "bus", "late", "passport", "lost", "luggage",
+          "room", "change", "date", "payment", "card", "guide", "ticket", "meal")
+ACTIONS = ("Logged in", "Viewed packages", "Booked package", "Submitted support request",
+           "Updated booking", "Uploaded document")
+
+
+def sizes(bookings):
+    """Row counts per table for a database with ``bookings`` bookings."""
+    return {
+        "users": max(10, bookings // 4),
+        "hotels": 40,
+        "guides": max(10, bookings // 2000),
+        "packages": max(5, min(200, bookings // 5000)),
+        "trips": max(10, bookings // 40),
+        "bookings": bookings,
+        "booking_files": bookings,
+        "travellers": bookings,
+        "support_requests": bookings // 5,
+        "activity_log": bookings * 3,
+    }
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+
+
+def _timestamp(rng, today, days=730):
+    moment = datetime.combine(today, datetime.min.time()) - timedelta(seconds=rng.randrange(days * 86400))
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _insert(conn, table, columns, rows):
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK_ROWS:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def _load(conn, rng, n, today):
+    # one salted hash shared by every account: a KDF per generated user
+    # would dominate the build time
+    password_hash = passwords.hash_password(PASSWORD)
+    _insert(conn, "users", ["name", "passport_number", "nationality", "email", "phone",
+                            "password_hash", "role_id", "created_at"],
+            ((_name(rng), f"U{i:08d}", rng.choice(NATIONALITIES),
+              ADMIN_EMAIL if i == 1 else f"user{i}@bench.test", f"05{i:08d}",
+              password_hash, 1 if i == 1 else 2, _timestamp(rng, today))
+             for i in range(1, n["users"] + 1)))
+    _insert(conn, "hotels", ["name", "city", "rating"],
+            ((f"Hotel {i}", rng.choice(CITIES), rng.randint(3, 5)) for i in range(1, n["hotels"] + 1)))
+    _insert(conn, "guides", ["name", "phone", "email"],
+            ((_name(rng), f"055{i:07d}", f"guide{i}@bench.test") for i in range(1, n["guides"] + 1)))
+    _insert(conn, "packages", ["name", "price", "hotel", "duration_days", "transport"],
+            ((f"Package {i}", rng.randrange(1500, 9000, 50), f"Hotel {rng.randint(1, n['hotels'])}",
+              rng.choice((7, 10, 14, 21)), rng.choice(("Bus", "Train", "Flight")))
+             for i in range(1, n["packages"] + 1)))
+
+    # trips one year either side of today, 1-3 buses each
+    trips = [(rng.randint(1, n["packages"]), today + timedelta(days=rng.randint(-365, 365)))
+             for _ in range(n["trips"])]
+    _insert(conn, "trips", ["package_id", "trip_date", "price", "hotel_id"],
+            ((pkg, day.isoformat(), rng.randrange(1500, 9000, 50), rng.randint(1, n["hotels"]))
+             for pkg, day in trips))
+    buses = []  # [trip_id, capacity, seats taken]
+    for trip_id in range(1, n["trips"] + 1):
+        for _ in range(rng.randint(1, 3)):
+            buses.append([trip_id, rng.choice((45, 49, 50)), 0])
+    _insert(conn, "buses", ["trip_id", "bus_number", "capacity", "guide_id"],
+            ((trip_id, f"B-{i}", capacity, rng.randint(1, n["guides"]))
+             for i, (trip_id, capacity, _) in enumerate(buses, 1)))
+    buses_of = {}
+    for bus_id, bus in enumerate(buses, 1):
+        buses_of.setdefault(bus[0], []).append(bus_id)
+
+    statuses = [s for s, _ in STATUSES]
+    weights = [w for _, w in STATUSES]
+
+    def bookings():
+        for _ in range(n["bookings"]):
+            trip_id = rng.randint(1, n["trips"])
+            pkg, day = trips[trip_id - 1]
+            status = rng.choices(statuses, weights)[0]
+            bus_id = None
+            if status == "Confirmed" and rng.random() < 0.5:
+                bus_id = rng.choice(buses_of[trip_id])
+                bus = buses[bus_id - 1]
+                if bus[2] < bus[1]:
+                    bus[2] += 1
+                else:
+                    bus_id = None
+            yield (rng.randint(2, n["users"]), pkg, day.isoformat(), rng.choice(PAYMENTS),
+                   status, bus_id, _timestamp(rng, today))
+
+    _insert(conn, "bookings", ["user_id", "package_id", "travel_date", "payment_method",
+                               "status", "bus_id", "created_at"], bookings())
+    _insert(conn, "travellers", ["user_id", "name", "passport_number", "nationality", "dob",
+                                 "phone", "email", "emergency_contact", "handled_by", "created_at"],
+            ((rng.randint(2, n["users"]), _name(rng), f"P{i:08d}", rng.choice(NATIONALITIES),
+              (today - timedelta(days=rng.randint(18 * 365, 80 * 365))).isoformat(),
+              f"07{i:08d}", f"traveller{i}@bench.test", f"06{i:08d}", 1, _timestamp(rng, today))
+             for i in range(1, n["travellers"] + 1)))
+    _insert(conn, "support_requests", ["user_id", "issue", "status", "created_at"],
+            ((rng.randint(2, n["users"]), " ".join(rng.choices(ISSUES, k=rng.randint(4, 12))),
+              rng.choice(("Pending", "Resolved")), _timestamp(rng, today))
+             for _ in range(n["support_requests"])))
+    _insert(conn, "activity_log", ["user_id", "action", "timestamp"],
+            ((rng.randint(1, n["users"]), rng.choice(ACTIONS), _timestamp(rng, today))
+             for _ in range(n["activity_log"])))
+
+
+def _load_files(conn, rng, n):
+    def files():
+        for booking_id in range(1, n["booking_files"] + 1):
+            digest = f"{rng.getrandbits(256):064x}"
+            yield (booking_id, f"upload/{digest[:2]}/{digest[2:4]}/{digest}", f"passport_{booking_id}.pdf",
+                   digest, rng.randint(50_000, 2_000_000))
+
+    _insert(conn, "booking_files", ["booking_id", "file_path", "file_name", "sha256", "size"], files())
+
+
+def generate(path, bookings=10_000, seed=0, today=None):
+    """
+    Write a fresh synthetic database with ``bookings`` bookings to ``path``
+    (replacing any file there) and return the row counts from sizes().
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(seed)
+    today = today or date.today()
+    n = sizes(bookings)
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        db_migrations.migrate(conn, upto=BASE_SCHEMA)
+        conn.execute("BEGIN")
+        _load(conn, rng, n, today)
+        conn.execute("COMMIT")
+        db_migrations.migrate(conn)
+        conn.execute("BEGIN")
+        _load_files(conn, rng, n)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return n
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--bookings", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for table, rows in generate(args.path, args.bookings, args.seed).items():
+        print(f"{table:>16}: {rows}")
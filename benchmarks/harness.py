@@ -0,0 +1,408 @@
+"""
+harness.py – Time db_utils functions and AppTest page runs.
+
+UMRAH_DB must point at the benchmark database before this module is
+imported (db_pool reads it once); ``python -m benchmarks`` takes care of
+that. Each case is sampled until it has REPEAT runs or has used its time
+budget, whichever comes first, then run once more under tracemalloc for
+peak memory. Every public db_utils function must have a case here;
+uncovered() lists the ones that do not.
+"""
+
+import hashlib
+import inspect
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import activity_archive
+import analytics
+import audit_log
+import auth
+import db_fetch
+import db_utils as db
+from benchmarks import datagen
+from db_pool import DB_PATH, get_connection
+
+REPEAT = 20
+MIN_RUNS = 3
+BUDGET_S = 10.0          # per case
+TOLERANCE = 0.20         # p95 may grow 20% before it counts as a regression
+NOISE_FLOOR_MS = 2.0     # …and by at least this much
+APPS = ("umrah.py", "test.py")
+LOGIN_SESSIONS = 8       # concurrent sessions in the login burst case
+LOGINS_PER_SESSION = 2
+
+
+# ------------------ SAMPLE ARGUMENTS ------------------ #
+class Sample:
+    """Seeded picks of existing ids for cases that need arguments."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        conn = get_connection()
+        self.admin_id = conn.execute("SELECT MIN(id) FROM users WHERE role_id = 1").fetchone()[0]
+        self.user_ids = [r[0] for r in conn.execute(
+            "SELECT DISTINCT user_id FROM bookings ORDER BY user_id LIMIT 1000")]
+        self.booking_ids = [r[0] for r in conn.execute("SELECT id FROM bookings ORDER BY id DESC LIMIT 5000")]
+        self.ticket_ids = [r[0] for r in conn.execute(
+            "SELECT id FROM support_requests ORDER BY id DESC LIMIT 5000")]
+        self.trip_ids = [r[0] for r in conn.execute("SELECT DISTINCT trip_id FROM buses LIMIT 1000")]
+        self.bus_ids = [r[0] for r in conn.execute("SELECT id FROM buses ORDER BY id LIMIT 1000")]
+        self.package_id = conn.execute("SELECT MIN(id) FROM packages").fetchone()[0]
+        self.hotel_id = conn.execute("SELECT MIN(id) FROM hotels").fetchone()[0]
+        self.guide_id = conn.execute("SELECT MIN(id) FROM guides").fetchone()[0]
+        # every generated account logs in with datagen.PASSWORD
+        self.emails = [r[0] for r in conn.execute(
+            "SELECT email FROM users WHERE role_id = 2 ORDER BY id LIMIT 1000")]
+        self.middle_cursor = self.booking_ids[len(self.booking_ids) // 2] if self.booking_ids else None
+        self.serial = 0
+
+    def pick(self, ids):
+        return self.rng.choice(ids)
+
+    def many(self, ids, k=50):
+        return self.rng.sample(ids, min(k, len(ids)))
+
+    def unique(self, prefix):
+        self.serial += 1
+        return f"{prefix}{time.time_ns()}-{self.serial}"
+
+    def traveller(self):
+        return {"user_id": self.pick(self.user_ids), "name": "Bench Traveller",
+                "passport_number": self.unique("BT"), "nationality": "SA", "dob": "1980-01-01",
+                "phone": "0500000000", "email": "bench@bench.test", "emergency_contact": "",
+                "handled_by": self.admin_id}
+
+    def unseat(self, trip_id):
+        """Put a trip's seated confirmed bookings back in the allocation queue."""
+        with db.transaction() as conn:
+            conn.execute("""
+                UPDATE bookings SET bus_id = NULL
+                WHERE bus_id IN (SELECT id FROM buses WHERE trip_id = ?) AND status = 'Confirmed'""",
+                         (trip_id,))
+        return (trip_id,)
+
+    def legacy_login(self):
+        """Credentials of an account reset to a legacy SHA-256 hash, so logging in rehashes it."""
+        email = self.pick(self.emails)
+        with db.transaction() as conn:
+            conn.execute("UPDATE users SET password_hash = ? WHERE email = ?",
+                         (hashlib.sha256(datagen.PASSWORD.encode()).hexdigest(), email))
+        auth.user_cache.clear()
+        return (email, datagen.PASSWORD)
+
+    def restatus(self):
+        """Change one booking's status, which queues its month for analytics.refresh()."""
+        db.update_booking_status(self.pick(self.booking_ids), self.pick(["Pending", "Confirmed"]))
+        return ()
+
+
+# ------------------ CASES ------------------ #
+# name -> (call, setup): setup(sample) returns the call's arguments and is not
+# timed. Names without a suffix or module prefix are db_utils functions of the
+# same name.
+def _db_cases():
+    today = date.today()
+    recent = {"start": today - timedelta(days=30), "end": today}
+    # the readers of one dashboard rerun, fetched together and one by one
+    overview = {"stats": db.get_dashboard_stats,
+                "trips": (db.trip_slots_between, today, today + timedelta(days=365)),
+                "bookings": lambda: db.get_bookings_page(status="Confirmed", **recent),
+                "support": lambda: db.get_support_page(status="Pending", **recent),
+                "revenue": analytics.revenue}
+    return {
+        "cache_stats": (db.cache_stats, None),
+        "get_all_packages": (db.get_all_packages, None),
+        "add_package": (db.add_package, lambda s: (s.unique("Bench "), 1000, "Hotel", 7, "Bus")),
+        "add_traveller": (db.add_traveller, lambda s: (s.traveller(),)),
+        "get_travellers": (db.get_travellers, None),
+        "add_hotel": (db.add_hotel, lambda s: (s.unique("Bench Hotel "), "Makkah", 4)),
+        "get_hotels": (db.get_hotels, None),
+        "add_guide": (db.add_guide, lambda s: ("Bench Guide", "0500000000", "g@bench.test")),
+        "get_guides": (db.get_guides, None),
+        "add_trip": (db.add_trip, lambda s: (s.package_id, today.isoformat(), 1000, s.hotel_id)),
+        "get_trips": (db.get_trips, None),
+        "add_bus": (db.add_bus, lambda s: (s.pick(s.trip_ids), "B-bench", 50, s.guide_id)),
+        "get_buses": (db.get_buses, None),
+        "create_booking": (db.create_booking,
+                           lambda s: (s.pick(s.user_ids), s.package_id, today.isoformat(), "Cash")),
+        "save_booking_file": (db.save_booking_file,
+                              lambda s: (s.pick(s.booking_ids), "upload/bench.pdf")),
+        "save_booking_files": (db.save_booking_files, lambda s: (s.pick(s.booking_ids), [
+            {"file_path": "upload/bench.pdf", "file_name": "bench.pdf", "sha256": "0" * 64, "size": 1}] * 3)),
+        "referenced_documents": (db.referenced_documents, lambda s: (["0" * 64] * 3,)),
+        "get_user_bookings": (db.get_user_bookings, lambda s: (s.pick(s.user_ids),)),
+        "get_all_bookings": (db.get_all_bookings, None),
+        "verify_booking_view": (db.verify_booking_view, None),
+        "rebuild_booking_view": (db.rebuild_booking_view, None),
+        "update_booking_status": (db.update_booking_status,
+                                  lambda s: (s.pick(s.booking_ids), s.pick(["Pending", "Confirmed"]))),
+        "update_booking_statuses": (db.update_booking_statuses,
+                                    lambda s: (s.many(s.booking_ids), s.pick(["Pending", "Confirmed"]))),
+        "create_support_request": (db.create_support_request,
+                                   lambda s: (s.pick(s.user_ids), "bench visa refund")),
+        "get_user_support": (db.get_user_support, lambda s: (s.pick(s.user_ids),)),
+        "get_all_support": (db.get_all_support, None),
+        "update_support_status": (db.update_support_status,
+                                  lambda s: (s.pick(s.ticket_ids), s.pick(["Pending", "Resolved"]))),
+        "update_support_statuses": (db.update_support_statuses,
+                                    lambda s: (s.many(s.ticket_ids), s.pick(["Pending", "Resolved"]))),
+        "log_activity": (db.log_activity, lambda s: (s.admin_id, "Benchmark")),
+        "log_activities": (db.log_activities, lambda s: (s.admin_id, ["Benchmark"] * 50)),
+        "update_row": (db.update_row, lambda s: ("bookings", s.pick(s.booking_ids), {"payment_method": "Cash"})),
+        "update_rows": (db.update_rows, lambda s: ("bookings", {
+            i: {"payment_method": s.pick(["Cash", "Bank Transfer"])} for i in s.many(s.booking_ids)})),
+        "delete_row": (db.delete_row, lambda s: ("bookings", db.create_booking(
+            s.pick(s.user_ids), s.package_id, today.isoformat(), "Cash"))),
+        "package_rows": (db.package_rows, None),
+        "hotel_rows": (db.hotel_rows, None),
+        "guide_rows": (db.guide_rows, None),
+        "trip_rows": (db.trip_rows, None),
+        "package_ids": (db.package_ids, None),
+        "hotel_ids": (db.hotel_ids, None),
+        "guide_ids": (db.guide_ids, None),
+        "get_dashboard_stats": (db.get_dashboard_stats, None),
+        "verify_stats": (db.verify_stats, None),
+        "rebuild_stats": (db.rebuild_stats, None),
+        "get_trips_between": (db.get_trips_between, lambda s: (today, today + timedelta(days=60))),
+        "trip_slots_between": (db.trip_slots_between,
+                               lambda s: (today, today + timedelta(days=365), s.package_id)),
+        "get_trip_slot": (db.get_trip_slot, lambda s: (s.pick(s.trip_ids),)),
+        "get_bus_seats_remaining": (db.get_bus_seats_remaining, lambda s: (s.pick(s.bus_ids),)),
+        "get_seats_remaining": (db.get_seats_remaining, lambda s: (s.pick(s.trip_ids),)),
+        "allocate_trip": (db.allocate_trip, lambda s: s.unseat(s.pick(s.trip_ids))),
+        "search": (db.search, lambda s: (s.pick(["visa refund", "ahmed khan", "P0000", "package"]),)),
+        "bookings_query": (db.bookings_query, None),
+        "travellers_query": (db.travellers_query, None),
+        "support_query": (db.support_query, None),
+        "activity_query": (db.activity_query, None),
+        "get_bookings_page": (db.get_bookings_page, None),
+        "get_bookings_page[deep]": (lambda after: db.get_bookings_page(after=after),
+                                    lambda s: (s.middle_cursor,)),
+        "get_bookings_page[filtered]": (lambda: db.get_bookings_page(status="Confirmed", **recent), None),
+        "get_bookings_page[search]": (lambda: db.get_bookings_page(search="khan"), None),
+        "get_travellers_page": (db.get_travellers_page, None),
+        "get_support_page": (db.get_support_page, None),
+        "get_support_page[filtered]": (lambda: db.get_support_page(status="Pending", **recent), None),
+        "get_activity_page": (db.get_activity_page, None),
+        "get_activity_page[filtered]": (lambda: db.get_activity_page(**recent), None),
+        "auth.authenticate": (auth.authenticate, lambda s: (s.pick(s.emails), datagen.PASSWORD)),
+        "auth.authenticate[legacy]": (auth.authenticate, lambda s: s.legacy_login()),
+        "auth.login_burst": (login_burst, lambda s: (s.many(s.emails, LOGIN_SESSIONS * LOGINS_PER_SESSION),)),
+        "analytics.rebuild": (analytics.rebuild, None),
+        "analytics.refresh": (analytics.refresh, lambda s: s.restatus()),
+        "analytics.revenue": (analytics.revenue, None),
+        "analytics.occupancy_by_trip": (analytics.occupancy_by_trip, None),
+        "analytics.occupancy_by_bus": (analytics.occupancy_by_bus, None),
+        "analytics.funnel": (analytics.funnel, None),
+        "analytics.payment_mix": (analytics.payment_mix, None),
+        "db_fetch.fetch[overview]": (lambda: db_fetch.fetch(**overview), None),
+        "db_fetch.fetch[overview, inline]": (
+            lambda: {name: db_fetch._call(spec) for name, spec in overview.items()}, None),
+        # the first run moves every old month out; the timed ones are the
+        # scheduled no-op, and the reads below fan out over the segments
+        "activity_archive.archive": (activity_archive.archive, None),
+        "activity_archive.get_activity[user]": (activity_archive.get_activity,
+                                                lambda s: (s.pick(s.user_ids),)),
+        "activity_archive.get_activity[recent]": (lambda: activity_archive.get_activity(**recent), None),
+        "activity_archive.get_activity[archived]": (lambda: activity_archive.get_activity(
+            start=today - timedelta(days=365), end=today - timedelta(days=335)), None),
+    }
+
+
+def login_burst(emails, sessions=None, per_session=None):
+    """
+    ``sessions`` threads, each with its own pooled connection like a
+    Streamlit session, log in ``per_session`` times each, all starting
+    together.
+    """
+    sessions, per_session = sessions or LOGIN_SESSIONS, per_session or LOGINS_PER_SESSION
+    start = threading.Barrier(sessions)
+    failed = []
+
+    def session(i):
+        start.wait()
+        for j in range(per_session):
+            email = emails[(i * per_session + j) % len(emails)]
+            if auth.authenticate(email, datagen.PASSWORD) is None:
+                failed.append(email)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failed:
+        raise RuntimeError(f"login failed for {failed[0]}")
+
+
+def _app_case(script, role, page=None):
+    from streamlit.testing.v1 import AppTest
+
+    def setup(sample):
+        at = AppTest.from_file(_script_path(script), default_timeout=600)
+        user_id = sample.admin_id if role == 1 else sample.pick(sample.user_ids)
+        at.session_state.logged_in = True
+        at.session_state.user_id, at.session_state.role_id = user_id, role
+        at.session_state.user_name = "Bench"
+        if page is not None:
+            # first render untimed; the timed run is the rerun after navigating
+            at.run()
+            at.sidebar.radio[0].set_value(page)
+        return (at,)
+
+    def call(at):
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"{script}: {at.exception[0].value}")
+
+    return call, setup
+
+
+def _script_path(script):
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), script)
+
+
+def _app_cases():
+    cases = {}
+    for script in APPS:
+        cases[f"app:{script}[admin]"] = _app_case(script, 1)
+        cases[f"app:{script}[user]"] = _app_case(script, 2)
+    for page in ("📦 Packages", "📝 Book", "📋 Dashboard", "🆘 Support"):
+        cases[f"app:umrah.py[{page.split()[-1]}]"] = _app_case("umrah.py", 2, page)
+    cases["app:umrah.py[Admin]"] = _app_case("umrah.py", 1, "⚙️ Admin")
+    return cases
+
+
+def cases(include_apps=True):
+    return {**_db_cases(), **(_app_cases() if include_apps else {})}
+
+
+def uncovered():
+    """Public db_utils functions with no benchmark case."""
+    names = {name.split("[")[0] for name in _db_cases()}
+    return sorted(name for name, fn in inspect.getmembers(db, inspect.isfunction)
+                  if fn.__module__ == "db_utils" and not name.startswith("_") and name not in names)
+
+
+# ------------------ MEASURING ------------------ #
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def measure(call, setup, sample, repeat=REPEAT, budget_s=BUDGET_S):
+    """Return timing and peak-memory stats for one case, in ms and KiB."""
+    timings, started = [], time.perf_counter()
+    while len(timings) < repeat and (len(timings) < MIN_RUNS or time.perf_counter() - started < budget_s):
+        args = setup(sample) if setup else ()
+        db.cache.clear()  # time the query, not a cache hit
+        t0 = time.perf_counter()
+        call(*args)
+        timings.append((time.perf_counter() - t0) * 1000)
+
+    args = setup(sample) if setup else ()
+    db.cache.clear()
+    tracemalloc.start()
+    try:
+        call(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "runs": len(timings),
+        "p50_ms": round(_percentile(timings, 0.50), 3),
+        "p95_ms": round(_percentile(timings, 0.95), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(only=None, include_apps=True, repeat=REPEAT, budget_s=BUDGET_S, seed=0, progress=print):
+    """
+    Run every case (or those whose name contains one of ``only``) and return
+    the results document written by ``python -m benchmarks --out``.
+    """
+    conn = get_connection()
+    sample = Sample(seed)
+    results, errors = {}, {}
+    for name, (call, setup) in cases(include_apps).items():
+        if only and not any(part in name for part in only):
+            continue
+        try:
+            results[name] = measure(call, setup, sample, repeat, budget_s)
+        except Exception as exc:  # one broken case must not hide the rest
+            errors[name] = f"{type(exc).__name__}: {exc}"
+            progress(f"{name:<40} ERROR {errors[name]}")
+            continue
+        r = results[name]
+        if name == "auth.login_burst":
+            r["logins_per_s"] = round(LOGIN_SESSIONS * LOGINS_PER_SESSION * 1000 / r["p50_ms"], 1)
+        progress(f"{name:<40} p50 {r['p50_ms']:>10.2f} ms  p95 {r['p95_ms']:>10.2f} ms  "
+                 f"peak {r['peak_kib']:>10.1f} KiB  ({r['runs']} runs)"
+                 + (f"  {r['logins_per_s']} logins/s" if "logins_per_s" in r else ""))
+    audit_log.writer.flush()
+    return {
+        "meta": {
+            "db": DB_PATH,
+            "bookings": conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0],
+            "seed": seed,
+            "repeat": repeat,
+            "date": date.today().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "login_sessions": LOGIN_SESSIONS,
+        },
+        "results": results,
+        "errors": errors,
+        "uncovered": uncovered(),
+    }
+
+
+# ------------------ BASELINE ------------------ #
+def load(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save(report, path):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2, ensure_ascii=False)
+
+
+def compare(report, baseline, tolerance=TOLERANCE, floor_ms=NOISE_FLOOR_MS):
+    """
+    Return [(case, metric, baseline, current)] for every case whose p95
+    latency or peak memory grew by more than ``tolerance`` (latency also by
+    more than ``floor_ms``) against ``baseline``.
+    """
+    regressions = []
+    for name, current in report["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        if (current["p95_ms"] > before["p95_ms"] * (1 + tolerance)
+                and current["p95_ms"] - before["p95_ms"] > floor_ms):
+            regressions.append((name, "p95_ms", before["p95_ms"], current["p95_ms"]))
+        if current["peak_kib"] > before["peak_kib"] * (1 + tolerance) + 64:
+            regressions.append((name, "peak_kib", before["peak_kib"], current["peak_kib"]))
+    return regressions
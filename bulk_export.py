@@ -0,0 +1,120 @@
+"""
+bulk_export.py – Streaming CSV/Parquet export of the admin listings.
+
+Rows are read with the same filtered queries the admin pages use
+(db_utils.*_query), CHUNK_SIZE rows at a time, and each chunk is appended to
+the output before the next is read, so memory stays bounded by the chunk
+size rather than the table size. The activity export starts with the
+archived months (activity_archive), one segment at a time.
+
+Every chunk is cast to the column types declared on the export's source
+table (nullable Int64 for ids and counts), so a column that happens to be
+all NULL in one chunk is typed like the rest: CSV writes ``1``, not
+``1.0``, and every Parquet row group shares one schema.
+"""
+
+import io
+
+import pandas as pd
+
+import db_utils as db
+from db_pool import get_connection
+
+CHUNK_SIZE = 5000
+
+EXPORTS = {
+    "bookings": db.bookings_query,
+    "travellers": db.travellers_query,
+    "support": db.support_query,
+    "activity": db.activity_query,
+}
+FORMATS = ("csv", "parquet")
+# table each export reads from, for its declared column types
+SOURCES = {
+    "bookings": "booking_view",
+    "travellers": "travellers",
+    "support": "support_requests",
+    "activity": "activity_log",
+}
+
+
+def column_types(entity):
+    """{column: pandas dtype} from the declared types of ``entity``'s source table."""
+    types = {}
+    for _, name, declared, *_ in get_connection().execute(f"PRAGMA table_info({SOURCES[entity]})"):
+        declared = declared.upper()
+        # SQLite's affinity rules; DATE and TIMESTAMP columns hold text here
+        if "INT" in declared:
+            types[name] = "Int64"
+        elif any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+            types[name] = "Float64"
+        else:
+            types[name] = "string"
+    return types
+
+
+def iter_chunks(entity, chunksize=CHUNK_SIZE, **filters):
+    """Yield the filtered rows of ``entity`` in id order as DataFrames of column_types()."""
+    types = column_types(entity)
+    for chunk in _read_chunks(entity, chunksize, **filters):
+        yield chunk.astype({c: types[c] for c in chunk.columns if c in types})
+
+
+def _read_chunks(entity, chunksize, **filters):
+    if entity == "activity":
+        # archived months first: their rows are older than any left in the table
+        import activity_archive
+        yield from activity_archive.iter_segments(**filters)
+    sql, where, params, key = EXPORTS[entity](**filters)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {key}"
+    yield from pd.read_sql_query(sql, get_connection(), params=params, chunksize=chunksize)
+
+
+def _write_csv(chunks, handle):
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(handle, header=(i == 0), index=False)
+        rows += len(chunk)
+    return rows
+
+
+def _write_parquet(chunks, handle, types):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {"Int64": pa.int64(), "Float64": pa.float64(), "string": pa.string()}
+    writer, schema, rows = None, None, 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.schema([(c, arrow_types[types.get(c, "string")]) for c in chunk.columns])
+                writer = pq.ParquetWriter(handle, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export(entity, dest, fmt="csv", chunksize=CHUNK_SIZE, **filters):
+    """
+    Stream ``entity`` to ``dest`` (a path or a binary file object) as CSV or
+    Parquet and return the number of rows written.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported export format: {fmt}")
+    chunks = iter_chunks(entity, chunksize, **filters)
+    if fmt == "parquet":
+        return _write_parquet(chunks, dest, column_types(entity))
+    if isinstance(dest, (str, bytes)) or hasattr(dest, "__fspath__"):
+        with open(dest, "w", newline="", encoding="utf-8") as handle:
+            return _write_csv(chunks, handle)
+    handle = io.TextIOWrapper(dest, encoding="utf-8", newline="")
+    try:
+        return _write_csv(chunks, handle)
+    finally:
+        handle.flush()
+        handle.detach()
@@ -0,0 +1,204 @@
+"""
+bulk_import.py – Chunked CSV/Excel import for travellers, trips, buses and
+bookings.
+
+Files are streamed CHUNK_SIZE rows at a time. Each chunk is validated and its
+foreign keys resolved (package/hotel/guide names, user emails, trip/bus ids)
+in vectorized pandas passes, then inserted with one executemany inside one
+transaction. Bad rows are reported and skipped; they never abort the load.
+"""
+
+import sqlite3
+
+import pandas as pd
+
+from db_cache import invalidate
+from db_pool import call_after_commit, transaction
+
+CHUNK_SIZE = 1000
+
+# lookups: source column -> (table, key column, target column)
+ENTITIES = {
+    "travellers": {
+        "table": "travellers",
+        "columns": ["user_id", "name", "passport_number", "nationality", "dob", "phone",
+                    "email", "emergency_contact", "handled_by"],
+        "required": ["name", "passport_number"],
+        "optional": ["nationality", "dob", "phone", "email", "emergency_contact", "user_email"],
+        "dates": ["dob"],
+        "numbers": [],
+        "lookups": {"user_email": ("users", "email", "user_id")},
+        "unique": "passport_number",
+    },
+    "trips": {
+        "table": "trips",
+        "columns": ["package_id", "trip_date", "price", "hotel_id"],
+        "required": ["package", "trip_date"],
+        "optional": ["price", "hotel"],
+        "dates": ["trip_date"],
+        "numbers": ["price"],
+        "lookups": {"package": ("packages", "name", "package_id"),
+                    "hotel": ("hotels", "name", "hotel_id")},
+    },
+    "buses": {
+        "table": "buses",
+        "columns": ["trip_id", "bus_number", "capacity", "guide_id"],
+        "required": ["trip_id", "bus_number", "capacity"],
+        "optional": ["guide"],
+        "dates": [],
+        "numbers": ["trip_id", "capacity"],
+        "lookups": {"trip_id": ("trips", "id", "trip_id"),
+                    "guide": ("guides", "name", "guide_id")},
+    },
+    "bookings": {
+        "table": "bookings",
+        "columns": ["user_id", "package_id", "travel_date", "payment_method", "status", "bus_id"],
+        "required": ["user_email", "package", "travel_date"],
+        "optional": ["payment_method", "status", "bus_id"],
+        "dates": ["travel_date"],
+        "numbers": ["bus_id"],
+        "lookups": {"user_email": ("users", "email", "user_id"),
+                    "package": ("packages", "name", "package_id"),
+                    "bus_id": ("buses", "id", "bus_id")},
+        "defaults": {"status": "Pending"},
+    },
+}
+
+
+# ------------------ READING ------------------ #
+def read_chunks(source, chunksize=CHUNK_SIZE):
+    """Yield DataFrames of at most ``chunksize`` rows from a CSV or .xlsx file."""
+    name = str(getattr(source, "name", source)).lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        yield from _excel_chunks(source, chunksize)
+    else:
+        # dtype=str keeps passport/phone numbers exactly as written
+        yield from pd.read_csv(source, chunksize=chunksize, dtype=str)
+
+
+def _excel_chunks(source, chunksize):
+    from openpyxl import load_workbook
+
+    rows = load_workbook(source, read_only=True, data_only=True).active.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    batch, start = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunksize:
+            yield pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)))
+            start, batch = start + len(batch), []
+    if batch:
+        yield pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)))
+
+
+# ------------------ VALIDATION ------------------ #
+def _in_query(conn, sql, values):
+    values = list(values)
+    if not values:
+        return []
+    return conn.execute(sql.format(marks=", ".join("?" * len(values))), values).fetchall()
+
+
+def _prepare(conn, spec, chunk, defaults):
+    """Normalize ``chunk`` in place and return a Series of per-row errors."""
+    errors = pd.Series(None, index=chunk.index, dtype=object)
+
+    def fail(mask, message):
+        errors[mask & errors.isna()] = message
+
+    for col in spec["required"]:
+        fail(chunk[col].isna() | (chunk[col].astype(str).str.strip() == ""), f"missing {col}")
+    for col in spec["dates"]:
+        parsed = pd.to_datetime(chunk[col], errors="coerce")
+        fail(chunk[col].notna() & parsed.isna(), f"invalid date in {col}")
+        chunk[col] = parsed.dt.strftime("%Y-%m-%d")
+    for col in spec["numbers"]:
+        parsed = pd.to_numeric(chunk[col], errors="coerce")
+        fail(chunk[col].notna() & parsed.isna(), f"invalid number in {col}")
+        chunk[col] = parsed
+
+    for src, (table, key, target) in spec["lookups"].items():
+        values = raw = chunk[src].copy()  # src may be its own target (trip_id, bus_id)
+        column = key
+        if key == "name":
+            # catalogue names are matched case- and whitespace-insensitively
+            values = values.str.strip().str.lower()
+            column = f"lower(trim({key}))"
+        found = dict(_in_query(conn, f"SELECT {column}, id FROM {table} WHERE {column} IN ({{marks}})",
+                               values.dropna().unique().tolist()))
+        chunk[target] = values.map(found).astype("Int64")
+        fail(raw.notna() & chunk[target].isna(), f"unknown {src}")
+
+    unique = spec.get("unique")
+    if unique:
+        fail(chunk[unique].notna() & chunk[unique].duplicated(keep="first"),
+             f"duplicate {unique} in file")
+        existing = {v for (v,) in _in_query(
+            conn, f"SELECT {unique} FROM {spec['table']} WHERE {unique} IN ({{marks}})",
+            chunk[unique].dropna().unique().tolist())}
+        fail(chunk[unique].isin(existing), f"{unique} already exists")
+
+    for col, value in {**spec.get("defaults", {}), **defaults}.items():
+        chunk[col] = chunk[col].fillna(value) if col in chunk else value
+    return errors
+
+
+# ------------------ LOADING ------------------ #
+def _insert(conn, spec, rows, row_numbers, report):
+    cols = spec["columns"]
+    sql = (f"INSERT INTO {spec['table']} ({', '.join(cols)}) "
+           f"VALUES ({', '.join('?' * len(cols))})")
+    conn.execute("SAVEPOINT bulk_chunk")
+    try:
+        conn.executemany(sql, rows)
+        conn.execute("RELEASE bulk_chunk")
+        report["inserted"] += len(rows)
+        return
+    except sqlite3.IntegrityError:
+        conn.execute("ROLLBACK TO bulk_chunk")
+        conn.execute("RELEASE bulk_chunk")
+    # a constraint the checks above did not catch (e.g. a concurrent insert):
+    # redo this chunk row by row so only the offending rows are rejected
+    for row, number in zip(rows, row_numbers):
+        try:
+            conn.execute(sql, row)
+            report["inserted"] += 1
+        except sqlite3.IntegrityError as exc:
+            report["errors"].append((number, str(exc)))
+
+
+def import_file(entity, source, chunksize=CHUNK_SIZE, defaults=None):
+    """
+    Import ``source`` (path or file-like CSV/.xlsx) into ``entity``.
+
+    Returns {"inserted": n, "errors": [(data_row, message), ...]}, where
+    data_row is 1-based and excludes the header. Raises ValueError when the
+    file is missing required columns.
+    """
+    spec = ENTITIES[entity]
+    defaults = defaults or {}
+    report = {"inserted": 0, "errors": []}
+    for chunk in read_chunks(source, chunksize):
+        chunk = chunk.rename(columns=lambda c: str(c).strip().lower().replace(" ", "_"))
+        missing = [c for c in spec["required"] if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"missing column(s): {', '.join(missing)}")
+        for col in set(spec["columns"]) | set(spec["lookups"]):
+            if col not in chunk.columns:
+                chunk[col] = None
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+
+        with transaction() as conn:
+            errors = _prepare(conn, spec, chunk, defaults)
+            valid = chunk[errors.isna()]
+            rows = list(valid[spec["columns"]].astype(object)
+                        .where(valid[spec["columns"]].notna(), None)
+                        .itertuples(index=False, name=None))
+            _insert(conn, spec, rows, [i + 1 for i in valid.index], report)
+            call_after_commit(lambda: invalidate(spec["table"]))
+        report["errors"] += [(i + 1, msg) for i, msg in errors.dropna().items()]
+
+    report["errors"].sort()
+    return report
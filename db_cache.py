@@ -0,0 +1,110 @@
+"""
+db_cache.py – Process-wide LRU cache for db_utils read queries.
+
+Entries are keyed by (sql, params) and remember which tables they read, so a
+write only evicts the results that depend on the tables it touched. Each
+invalidation also bumps its tables' generation: a reader takes
+generation() before its query and passes it to put(), which drops the
+value if a write was invalidated in between, so a result read just before
+a concurrent commit is never cached after that commit. Writers
+call invalidate(), which evicts from every registered cache (db_utils' own
+and, once auth is imported, its user cache).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 256
+TTL_SECONDS = 300  # safety net for writes made by other processes
+
+
+class QueryCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, tables, value)
+        self._by_table = {}            # table -> set of keys
+        self._generations = {}         # table -> invalidations so far
+        self._epoch = 0                # clear() calls so far
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def generation(self, tables):
+        """A token for put(): changes whenever any of ``tables`` is invalidated."""
+        with self._lock:
+            return self._epoch, tuple(self._generations.get(t, 0) for t in tables)
+
+    def put(self, key, tables, value, generation=None):
+        """Cache ``value``; skipped when ``generation`` is no longer current."""
+        with self._lock:
+            if generation is not None and generation != (
+                    self._epoch, tuple(self._generations.get(t, 0) for t in tables)):
+                return  # read before a write that has since been invalidated
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tables, value)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tables):
+        """Drop every entry that read any of ``tables``."""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._by_table.get(table, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_table.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+    def _drop(self, key):
+        _, tables, _ = self._entries.pop(key)
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+
+cache = QueryCache()
+caches = [cache]  # every cache invalidate() evicts from
+
+
+def register(query_cache):
+    """Have writes to the tables ``query_cache`` tags evict from it too."""
+    caches.append(query_cache)
+    return query_cache
+
+
+def invalidate(*tables):
+    """Drop the entries that read any of ``tables`` from every registered cache."""
+    for query_cache in caches:
+        query_cache.invalidate(*tables)
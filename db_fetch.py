@@ -0,0 +1,74 @@
+"""
+db_fetch.py – Run independent readers concurrently.
+
+    results = fetch(stats=db.get_dashboard_stats,
+                    bookings=(db.get_user_bookings, user_id))
+    stats = results["stats"].unwrap()
+
+Each call runs on a small thread pool. Every worker thread has its own
+pooled connection (db_pool), and WAL lets readers run side by side, so a
+page waits for its slowest query instead of the sum of them all. SQLite
+releases the GIL while a statement runs; building the DataFrame does not,
+so the gain is largest for queries that spend their time in SQLite.
+
+A failing call does not affect the others: its Result carries the error.
+Calls run inline, one after another, inside a transaction (the workers
+could not see its uncommitted writes) and when issued from a worker.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple, Optional
+
+import db_metrics
+from db_pool import in_transaction
+
+MAX_WORKERS = int(os.environ.get("UMRAH_FETCH_WORKERS", 4))
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="db-fetch")
+_local = threading.local()
+
+
+class Result(NamedTuple):
+    value: Any
+    error: Optional[Exception]
+    ms: float
+
+    def unwrap(self):
+        """The value, or the call's exception raised here."""
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _call(spec):
+    fn, *args = spec if isinstance(spec, tuple) else (spec,)
+    started = time.perf_counter()
+    try:
+        value = fn(*args)
+    except Exception as exc:
+        return Result(None, exc, (time.perf_counter() - started) * 1000)
+    return Result(value, None, (time.perf_counter() - started) * 1000)
+
+
+def _work(spec, context):
+    _local.worker = True
+    try:
+        with db_metrics.attached(context):
+            return _call(spec)
+    finally:
+        _local.worker = False
+
+
+def fetch(**calls):
+    """
+    Run every call (a function, or a tuple of function and arguments)
+    concurrently and return {name: Result} once all have finished.
+    """
+    if len(calls) < 2 or in_transaction() or getattr(_local, "worker", False):
+        return {name: _call(spec) for name, spec in calls.items()}
+    context = db_metrics.snapshot()  # keep the statements on the caller's run and page
+    futures = {name: _pool.submit(_work, spec, context) for name, spec in calls.items()}
+    return {name: future.result() for name, future in futures.items()}
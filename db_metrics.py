@@ -0,0 +1,363 @@
+"""
+db_metrics.py – Per-statement query instrumentation and slow-query log.
+
+Every pooled connection is a MeteredConnection (see db_pool._open). While
+metrics are enabled (UMRAH_QUERY_METRICS=1 or ``enable()``) each statement
+is timed through execute and every fetch, its rows are counted, and it is
+attributed to the db_utils/auth helper that issued it and to the current
+page scope. SQLite's trace callback counts the programs each statement
+ran: one per executed row plus one per trigger it fired.
+Helpers that build a DataFrame wrap it in ``frame()`` so the build time is
+recorded next to the query time. Statements slower than SLOW_MS go to the
+slow log together with their EXPLAIN QUERY PLAN.
+
+When disabled the only cost is one flag check per execute/fetch call.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+enabled = os.environ.get("UMRAH_QUERY_METRICS") == "1"
+SLOW_MS = float(os.environ.get("UMRAH_SLOW_QUERY_MS", 100))
+MAX_RECENT = 5000      # statements kept for the rolling histogram
+MAX_SLOW = 200
+MAX_RUNS = 50
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float("inf"))
+
+# helpers are the public functions of these modules
+HELPER_MODULES = {"db_utils", "auth", "audit_log", "bulk_import", "bulk_export", "admin_ui", "analytics",
+                  "activity_archive"}
+
+_local = threading.local()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+# ------------------ CONTEXT ------------------ #
+def begin_run(label):
+    """Start a new rerun on this thread; its statements are totalled together."""
+    _local.run = metrics.new_run(label)
+    _local.scopes = []
+
+
+def set_page(name):
+    """
+    Attribute the rest of this rerun's statements to page ``name``, nested
+    under the page set before it (e.g. a section inside the admin page).
+    """
+    scopes = getattr(_local, "scopes", None)
+    if scopes is None:
+        scopes = _local.scopes = []
+    scopes.append(name)
+    metrics.label_run(getattr(_local, "run", None), name)
+
+
+@contextmanager
+def scope(name):
+    """Attribute the enclosed statements to ``name`` (a page, tab or panel)."""
+    scopes = getattr(_local, "scopes", None)
+    if scopes is None:
+        scopes = _local.scopes = []
+    scopes.append(name)
+    try:
+        yield
+    finally:
+        scopes.pop()
+
+
+def snapshot():
+    """This thread's run and page scopes, to hand work to another thread."""
+    return getattr(_local, "run", None), tuple(getattr(_local, "scopes", None) or ())
+
+
+@contextmanager
+def attached(context):
+    """Attribute the enclosed statements to the run and scopes of a snapshot()."""
+    saved = getattr(_local, "run", None), getattr(_local, "scopes", None)
+    _local.run, _local.scopes = context[0], list(context[1])
+    try:
+        yield
+    finally:
+        _local.run, _local.scopes = saved
+
+
+def _current_scope():
+    scopes = getattr(_local, "scopes", None)
+    return " / ".join(scopes) if scopes else ""
+
+
+def _caller():
+    """The nearest public helper on the stack, e.g. ``db_utils.get_trips``."""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        name = frame.f_code.co_name
+        if module in HELPER_MODULES and not name.startswith("_"):
+            return f"{module}.{name}"
+        if fallback is None and module not in (__name__, "db_pool") and not module.startswith("pandas"):
+            fallback = f"{module}.{name}"
+        frame = frame.f_back
+    return fallback or "?"
+
+
+# ------------------ COLLECTOR ------------------ #
+class QueryMetrics:
+    def __init__(self, max_recent=MAX_RECENT, max_slow=MAX_SLOW, max_runs=MAX_RUNS):
+        self._recent = deque(maxlen=max_recent)
+        self._slow = deque(maxlen=max_slow)
+        self._runs = OrderedDict()  # run id -> totals
+        self._max_runs = max_runs
+        self._next_run = 0
+        self._lock = threading.Lock()
+
+    def new_run(self, label):
+        with self._lock:
+            self._next_run += 1
+            run = self._next_run
+            self._runs[run] = {"run": run, "label": label, "started": time.time(),
+                               "statements": 0, "rows": 0, "query_ms": 0.0, "frame_ms": 0.0,
+                               "by_helper": {}, "by_scope": {}}
+            while len(self._runs) > self._max_runs:
+                self._runs.popitem(last=False)
+            return run
+
+    def label_run(self, run, page):
+        with self._lock:
+            totals = self._runs.get(run)
+            if totals is not None:
+                totals["label"] = f"{totals['label']} · {page}"
+
+    def statement(self, sql):
+        record = {"at": time.time(), "run": getattr(_local, "run", None), "scope": _current_scope(),
+                  "helper": _caller(), "sql": " ".join(sql.split()), "ms": 0.0, "rows": 0,
+                  "frame_ms": 0.0, "programs": 0, "plan": None}
+        with self._lock:
+            self._recent.append(record)
+            totals = self._runs.get(record["run"])
+            if totals is not None:
+                totals["statements"] += 1
+                for key, group in ((record["helper"], "by_helper"), (record["scope"], "by_scope")):
+                    entry = totals[group].setdefault(key, {"statements": 0, "ms": 0.0, "rows": 0})
+                    entry["statements"] += 1
+        _local.last = record
+        frames = getattr(_local, "frames", None)
+        if frames:
+            frames[-1].append(record)
+        return record
+
+    def add(self, record, ms, rows=0):
+        """Add execute/fetch time and rows to ``record``; True once it turns slow."""
+        before = record["ms"]
+        record["ms"] += ms
+        record["rows"] += rows
+        with self._lock:
+            totals = self._runs.get(record["run"])
+            if totals is not None:
+                totals["rows"] += rows
+                totals["query_ms"] += ms
+                for key, group in ((record["helper"], "by_helper"), (record["scope"], "by_scope")):
+                    entry = totals[group][key]
+                    entry["ms"] += ms
+                    entry["rows"] += rows
+            if before < SLOW_MS <= record["ms"]:
+                self._slow.append(record)
+                return True
+        return False
+
+    def add_frame(self, records, ms):
+        if not records:
+            return
+        records[-1]["frame_ms"] += ms  # the query the frame was built from
+        with self._lock:
+            totals = self._runs.get(records[-1]["run"])
+            if totals is not None:
+                totals["frame_ms"] += ms
+
+    def histogram(self):
+        """Rolling latency histogram per helper over the recent statements."""
+        with self._lock:
+            recent = list(self._recent)
+        rows = {}
+        for record in recent:
+            row = rows.setdefault(record["helper"], {"helper": record["helper"], "statements": 0,
+                                                     "total_ms": 0.0, "rows": 0,
+                                                     **{_bucket_label(b): 0 for b in BUCKETS_MS}})
+            row["statements"] += 1
+            row["total_ms"] += record["ms"]
+            row["rows"] += record["rows"]
+            row[_bucket_label(next(b for b in BUCKETS_MS if record["ms"] <= b))] += 1
+        return sorted(rows.values(), key=lambda r: -r["total_ms"])
+
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def runs(self):
+        """Totals of the most recent reruns, newest first."""
+        with self._lock:
+            return [dict(totals) for totals in reversed(self._runs.values())]
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._slow.clear()
+            self._runs.clear()
+
+
+def _bucket_label(bound):
+    return f"> {BUCKETS_MS[-2]:g} ms" if bound == float("inf") else f"≤ {bound:g} ms"
+
+
+def _explain(conn, sql, params):
+    if sql.split(None, 1)[0].upper() not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+        return None
+    try:
+        # a plain sqlite3 cursor, so the EXPLAIN itself is not metered
+        plan = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)
+        return "\n".join(row[3] for row in plan)
+    except sqlite3.Error as exc:
+        return f"(no plan: {exc})"
+
+
+metrics = QueryMetrics()
+
+
+# ------------------ DATAFRAMES ------------------ #
+class _NoFrame:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_FRAME = _NoFrame()
+
+
+class _Frame:
+    def __enter__(self):
+        self.records = []
+        frames = getattr(_local, "frames", None)
+        if frames is None:
+            frames = _local.frames = []
+        frames.append(self.records)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        _local.frames.pop()
+        metrics.add_frame(self.records, elapsed - sum(r["ms"] for r in self.records))
+        return False
+
+
+def frame():
+    """Wrap a read_sql_query call so its DataFrame build time is recorded."""
+    return _Frame() if enabled else _NO_FRAME
+
+
+# ------------------ CONNECTION ------------------ #
+class MeteredCursor(sqlite3.Cursor):
+    _record = None
+    _params = None
+
+    def execute(self, sql, parameters=()):
+        if not enabled:
+            self._record = None
+            return super().execute(sql, parameters)
+        self._record, self._params = metrics.statement(sql), parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add((time.perf_counter() - started) * 1000, 0)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not enabled:
+            self._record = None
+            return super().executemany(sql, seq_of_parameters)
+        self._record, self._params = metrics.statement(sql), None
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add((time.perf_counter() - started) * 1000, 0)
+
+    def fetchone(self):
+        if self._record is None:
+            return super().fetchone()
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add((time.perf_counter() - started) * 1000, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._record is None:
+            return super().fetchmany(size)
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._add((time.perf_counter() - started) * 1000, len(rows))
+        return rows
+
+    def fetchall(self):
+        if self._record is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add((time.perf_counter() - started) * 1000, len(rows))
+        return rows
+
+    def _add(self, ms, rows):
+        record = self._record
+        if metrics.add(record, ms, rows) and self._params is not None:
+            record["plan"] = _explain(self.connection, record["sql"], self._params)
+
+
+class MeteredConnection(sqlite3.Connection):
+    """sqlite3.Connection whose statements are timed while metrics are on."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tracing = False
+
+    def cursor(self, factory=MeteredCursor):
+        if enabled and not self._tracing:
+            self._start_trace()
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not enabled:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not enabled:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def set_trace_callback(self, callback):
+        # another callback (e.g. the plan check's) stays until it is cleared;
+        # then the next cursor() puts ours back
+        super().set_trace_callback(callback)
+        self._tracing = callback is not None
+
+    def _start_trace(self):
+        # SQLite reports every program it starts: the statement (once per
+        # executemany row) and each trigger the statement fires
+        def on_trace(_):
+            record = getattr(_local, "last", None)
+            if enabled and record is not None:
+                record["programs"] += 1
+
+        self.set_trace_callback(on_trace)
+        self._tracing = True
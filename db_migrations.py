@@ -0,0 +1,659 @@
+"""
+db_migrations.py – Versioned schema migrations for umrah.db.
+
+Migrations are applied in order the first time a process opens the database
+(see db_pool.get_connection) and recorded in the ``schema_version`` table.
+Append new migrations to MIGRATIONS; never edit one that has shipped.
+
+    python db_migrations.py                 # apply pending migrations
+    python db_migrations.py --check-plans   # fail on unexpected full scans
+    python db_migrations.py --verify-stats  # compare counters with a recount
+    python db_migrations.py --rebuild-stats # recompute counters from scratch
+    python db_migrations.py --verify-booking-view   # compare with the live join
+    python db_migrations.py --rebuild-booking-view  # repopulate from the live join
+    python db_migrations.py --verify-analytics      # refresh, then compare with a recompute
+    python db_migrations.py --rebuild-analytics     # recompute summaries from scratch
+"""
+
+import inspect
+import sys
+
+# ------------------ STATS COUNTERS ------------------ #
+# Tables counted in ``stats`` and the column they are broken down by
+# (None: a single total row with status '').
+STATS_TABLES = {
+    "trips": None,
+    "travellers": None,
+    "bookings": "status",
+    "support_requests": "status",
+}
+
+
+def _stats_key(table, status, row):
+    return f"COALESCE({row}.{status}, '')" if status else "''"
+
+
+def _stats_triggers(table, status):
+    bump = ("INSERT INTO stats (entity, status, n) VALUES ('{t}', {k}, {d}) "
+            "ON CONFLICT(entity, status) DO UPDATE SET n = n + {d};")
+    new, old = _stats_key(table, status, "NEW"), _stats_key(table, status, "OLD")
+    triggers = [
+        f"""CREATE TRIGGER IF NOT EXISTS stats_{table}_ins AFTER INSERT ON {table}
+            BEGIN {bump.format(t=table, k=new, d=1)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS stats_{table}_del AFTER DELETE ON {table}
+            BEGIN {bump.format(t=table, k=old, d=-1)} END""",
+    ]
+    if status:
+        triggers.append(
+            f"""CREATE TRIGGER IF NOT EXISTS stats_{table}_upd AFTER UPDATE OF {status} ON {table}
+                WHEN OLD.{status} IS NOT NEW.{status}
+                BEGIN {bump.format(t=table, k=old, d=-1)} {bump.format(t=table, k=new, d=1)} END""")
+    return triggers
+
+
+def stats_recount_sql(table, status):
+    return (f"SELECT '{table}', {_stats_key(table, status, table)}, COUNT(*) "
+            f"FROM {table} GROUP BY 2")
+
+
+STATS_RECOUNT = [
+    "DELETE FROM stats",
+    *[f"INSERT INTO stats (entity, status, n) {stats_recount_sql(t, s)}"
+      for t, s in STATS_TABLES.items()],
+]
+
+
+# ------------------ BUS LOAD COUNTERS ------------------ #
+# bus_load.seats = bookings on the bus that are not Cancelled.
+_SEATED = "{row}.bus_id IS NOT NULL AND {row}.status IS NOT 'Cancelled'"
+
+
+def _bus_load_bump(row, delta):
+    return (f"INSERT INTO bus_load (bus_id, seats) SELECT {row}.bus_id, {delta} "
+            f"WHERE {_SEATED.format(row=row)} "
+            f"ON CONFLICT(bus_id) DO UPDATE SET seats = seats + {delta};")
+
+
+def _bus_load_triggers():
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS bus_load_ins AFTER INSERT ON bookings
+            BEGIN {_bus_load_bump("NEW", 1)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS bus_load_del AFTER DELETE ON bookings
+            BEGIN {_bus_load_bump("OLD", -1)} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS bus_load_upd AFTER UPDATE OF bus_id, status ON bookings
+            WHEN OLD.bus_id IS NOT NEW.bus_id OR OLD.status IS NOT NEW.status
+            BEGIN {_bus_load_bump("OLD", -1)} {_bus_load_bump("NEW", 1)} END""",
+    ]
+
+
+BUS_LOAD_RECOUNT_SQL = (f"SELECT bus_id, COUNT(*) FROM bookings "
+                        f"WHERE {_SEATED.format(row='bookings')} GROUP BY bus_id")
+BUS_LOAD_RECOUNT = [
+    "DELETE FROM bus_load",
+    f"INSERT INTO bus_load (bus_id, seats) {BUS_LOAD_RECOUNT_SQL}",
+]
+
+
+# ------------------ BOOKING READ MODEL ------------------ #
+# booking_view holds one pre-joined row per booking, in the shape of the
+# admin listing. Every source table refreshes the affected rows through
+# triggers: delete them from the view, then re-select them from the live
+# join, which keeps the INNER/LEFT join semantics exact.
+BOOKING_VIEW_COLUMNS = ["id", "user_id", "user_name", "package_id", "package_name", "bus_id",
+                        "bus_number", "trip_id", "trip_date", "guide_name", "travel_date",
+                        "payment_method", "status", "created_at"]
+
+BOOKING_VIEW_JOIN = """
+        SELECT b.id, b.user_id, u.name, b.package_id, p.name, b.bus_id,
+               bu.bus_number, t.id, t.trip_date, g.name, b.travel_date,
+               b.payment_method, b.status, b.created_at
+        FROM bookings b
+        JOIN users   u  ON b.user_id   = u.id
+        JOIN packages p ON b.package_id = p.id
+        LEFT JOIN buses  bu ON b.bus_id = bu.id
+        LEFT JOIN trips  t  ON bu.trip_id = t.id
+        LEFT JOIN guides g  ON bu.guide_id = g.id
+"""
+
+# source table -> (columns whose change matters, bookings predicate on {b}/{r})
+_BOOKING_VIEW_SOURCES = {
+    "bookings": (None, "{b}.id = {r}.id"),
+    "users": ("id, name", "{b}.user_id = {r}.id"),
+    "packages": ("id, name", "{b}.package_id = {r}.id"),
+    "buses": ("id, bus_number, trip_id, guide_id", "{b}.bus_id = {r}.id"),
+    "trips": ("id, trip_date", "{b}.bus_id IN (SELECT id FROM buses WHERE trip_id = {r}.id)"),
+    "guides": ("id, name", "{b}.bus_id IN (SELECT id FROM buses WHERE guide_id = {r}.id)"),
+}
+
+
+def _booking_view_refresh(predicate, row, guard=None):
+    guard = f" AND {guard}" if guard else ""
+    return (f"DELETE FROM booking_view WHERE {predicate.format(b='booking_view', r=row)}{guard}; "
+            f"INSERT INTO booking_view ({', '.join(BOOKING_VIEW_COLUMNS)}) "
+            f"{BOOKING_VIEW_JOIN} WHERE {predicate.format(b='b', r=row)}{guard};")
+
+
+def _booking_view_update_trigger(table):
+    columns, predicate = _BOOKING_VIEW_SOURCES[table]
+    update_of = f"UPDATE OF {columns}" if columns else "UPDATE"
+    # every predicate keys on the row's id: unless the id itself changed, the
+    # OLD and NEW refreshes hit the same bookings, so refresh them once
+    return f"""CREATE TRIGGER IF NOT EXISTS booking_view_{table}_upd AFTER {update_of} ON {table}
+                BEGIN {_booking_view_refresh(predicate, "OLD", guard="OLD.id IS NOT NEW.id")}
+                      {_booking_view_refresh(predicate, "NEW")} END"""
+
+
+def _booking_view_triggers():
+    triggers = []
+    for table, (columns, predicate) in _BOOKING_VIEW_SOURCES.items():
+        triggers += [
+            f"""CREATE TRIGGER IF NOT EXISTS booking_view_{table}_ins AFTER INSERT ON {table}
+                BEGIN {_booking_view_refresh(predicate, "NEW")} END""",
+            f"""CREATE TRIGGER IF NOT EXISTS booking_view_{table}_del AFTER DELETE ON {table}
+                BEGIN {_booking_view_refresh(predicate, "OLD")} END""",
+            _booking_view_update_trigger(table),
+        ]
+    return triggers
+
+
+BOOKING_VIEW_REBUILD = [
+    "DELETE FROM booking_view",
+    f"INSERT INTO booking_view ({', '.join(BOOKING_VIEW_COLUMNS)}) {BOOKING_VIEW_JOIN}",
+]
+
+
+# ------------------ FULL-TEXT SEARCH ------------------ #
+# External-content FTS5 indexes: the text lives in the source table, the
+# index is kept in step by triggers.
+FTS_INDEXES = {
+    "support_fts": ("support_requests", ["issue"]),
+    "travellers_fts": ("travellers", ["name", "passport_number", "email", "phone"]),
+    "packages_fts": ("packages", ["name", "hotel", "transport"]),
+}
+
+
+def _fts_statements(fts, table, columns):
+    cols = ", ".join(columns)
+    new = ", ".join(f"NEW.{c}" for c in columns)
+    old = ", ".join(f"OLD.{c}" for c in columns)
+    remove = f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', OLD.id, {old});"
+    add = f"INSERT INTO {fts} (rowid, {cols}) VALUES (NEW.id, {new});"
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ins AFTER INSERT ON {table} BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_del AFTER DELETE ON {table} BEGIN {remove} END",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_upd AFTER UPDATE OF {cols} ON {table}
+            BEGIN {remove} {add} END""",
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+
+
+# ------------------ ANALYTICS SUMMARIES ------------------ #
+# Report tables keyed by departure month (YYYY-MM), brought up to date by
+# analytics.refresh(). New bookings are found through a high-water mark on
+# bookings.created_at, so they need no trigger; edits that change a month
+# already summarised only queue that month in analytics_stale.
+# source table -> (events, columns whose change matters, months of row {r})
+_ANALYTICS_SOURCES = {
+    "bookings": (("DELETE", "UPDATE"), "package_id, travel_date, status, payment_method, bus_id",
+                 "SELECT substr({r}.travel_date, 1, 7)"),
+    "trips": (("INSERT", "DELETE", "UPDATE"), "package_id, trip_date, price",
+              "SELECT substr({r}.trip_date, 1, 7)"),
+    "buses": (("INSERT", "DELETE", "UPDATE"), "trip_id, capacity",
+              "SELECT substr(trip_date, 1, 7) FROM trips WHERE id = {r}.trip_id"),
+    # the fallback price of bookings without a matching trip
+    "packages": (("DELETE", "UPDATE"), "price",
+                 "SELECT DISTINCT substr(travel_date, 1, 7) FROM bookings WHERE package_id = {r}.id"),
+}
+
+
+def _analytics_stale(months, row):
+    # OR IGNORE also drops the NULL month of an undated row
+    return f"INSERT OR IGNORE INTO analytics_stale (month) {months.format(r=row)};"
+
+
+def _analytics_triggers():
+    triggers = []
+    for table, (events, columns, months) in _ANALYTICS_SOURCES.items():
+        for event in events:
+            suffix = {"INSERT": "ins", "DELETE": "del", "UPDATE": "upd"}[event]
+            if event == "UPDATE":
+                body = f"{_analytics_stale(months, 'OLD')} {_analytics_stale(months, 'NEW')}"
+                event = f"UPDATE OF {columns}"
+            else:
+                body = _analytics_stale(months, "NEW" if event == "INSERT" else "OLD")
+            triggers.append(f"""CREATE TRIGGER IF NOT EXISTS analytics_{table}_{suffix}
+                AFTER {event} ON {table} BEGIN {body} END""")
+    return triggers
+
+
+# (version, description, statements)
+MIGRATIONS = [
+    (1, "baseline schema", [
+        """CREATE TABLE IF NOT EXISTS roles (
+                id INTEGER PRIMARY KEY,
+                role_name TEXT UNIQUE)""",
+        "INSERT OR IGNORE INTO roles (id, role_name) VALUES (1, 'Admin'), (2, 'User')",
+        """CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                passport_number TEXT UNIQUE,
+                nationality TEXT,
+                email TEXT UNIQUE,
+                phone TEXT,
+                password_hash TEXT,
+                role_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(role_id) REFERENCES roles(id))""",
+        """CREATE TABLE IF NOT EXISTS packages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                price REAL,
+                hotel TEXT,
+                duration_days INTEGER,
+                transport TEXT)""",
+        """CREATE TABLE IF NOT EXISTS support_requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                issue TEXT,
+                status TEXT DEFAULT 'Pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id))""",
+        """CREATE TABLE IF NOT EXISTS travellers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                name TEXT,
+                passport_number TEXT UNIQUE,
+                nationality TEXT,
+                dob DATE,
+                phone TEXT,
+                email TEXT,
+                emergency_contact TEXT,
+                handled_by INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id),
+                FOREIGN KEY(handled_by) REFERENCES users(id))""",
+        """CREATE TABLE IF NOT EXISTS hotels (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE,
+                city TEXT,
+                rating INTEGER)""",
+        """CREATE TABLE IF NOT EXISTS guides (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                phone TEXT,
+                email TEXT)""",
+        """CREATE TABLE IF NOT EXISTS trips (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                package_id INTEGER,
+                trip_date DATE,
+                price REAL,
+                hotel_id INTEGER,
+                FOREIGN KEY(package_id) REFERENCES packages(id),
+                FOREIGN KEY(hotel_id) REFERENCES hotels(id))""",
+        """CREATE TABLE IF NOT EXISTS buses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                trip_id INTEGER,
+                bus_number TEXT,
+                capacity INTEGER,
+                guide_id INTEGER,
+                FOREIGN KEY(trip_id) REFERENCES trips(id),
+                FOREIGN KEY(guide_id) REFERENCES guides(id))""",
+        """CREATE TABLE IF NOT EXISTS bookings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                package_id INTEGER,
+                travel_date DATE,
+                payment_method TEXT,
+                status TEXT DEFAULT 'Pending',
+                bus_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id),
+                FOREIGN KEY(package_id) REFERENCES packages(id),
+                FOREIGN KEY(bus_id) REFERENCES buses(id))""",
+        """CREATE TABLE IF NOT EXISTS booking_files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                booking_id INTEGER,
+                file_path TEXT,
+                FOREIGN KEY(booking_id) REFERENCES bookings(id))""",
+        """CREATE TABLE IF NOT EXISTS activity_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                action TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users(id))""",
+    ]),
+    (2, "foreign-key, status and date indexes", [
+        # customer dashboard: covers every bookings column get_user_bookings reads
+        """CREATE INDEX IF NOT EXISTS idx_bookings_user
+               ON bookings(user_id, package_id, bus_id, travel_date, status, payment_method)""",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_package ON bookings(package_id)",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_bus ON bookings(bus_id)",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_travel_date ON bookings(travel_date)",
+        "CREATE INDEX IF NOT EXISTS idx_booking_files_booking ON booking_files(booking_id)",
+        "CREATE INDEX IF NOT EXISTS idx_support_user ON support_requests(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_support_status ON support_requests(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_trips_date ON trips(trip_date, package_id)",
+        "CREATE INDEX IF NOT EXISTS idx_trips_package ON trips(package_id)",
+        "CREATE INDEX IF NOT EXISTS idx_trips_hotel ON trips(hotel_id)",
+        "CREATE INDEX IF NOT EXISTS idx_buses_trip ON buses(trip_id)",
+        "CREATE INDEX IF NOT EXISTS idx_buses_guide ON buses(guide_id)",
+        "CREATE INDEX IF NOT EXISTS idx_travellers_user ON travellers(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_activity_user ON activity_log(user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_activity_time ON activity_log(timestamp)",
+    ]),
+    (3, "trigger-maintained dashboard counters", [
+        """CREATE TABLE IF NOT EXISTS stats (
+                entity TEXT,
+                status TEXT,
+                n INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (entity, status)) WITHOUT ROWID""",
+        *[sql for table, status in STATS_TABLES.items()
+          for sql in _stats_triggers(table, status)],
+        *STATS_RECOUNT,
+    ]),
+    (4, "content-addressed booking files", [
+        "ALTER TABLE booking_files ADD COLUMN file_name TEXT",
+        "ALTER TABLE booking_files ADD COLUMN sha256 TEXT",
+        "ALTER TABLE booking_files ADD COLUMN size INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_booking_files_sha256 ON booking_files(sha256)",
+    ]),
+    (5, "per-bus seat counters for allocation", [
+        """CREATE TABLE IF NOT EXISTS bus_load (
+                bus_id INTEGER PRIMARY KEY,
+                seats INTEGER NOT NULL DEFAULT 0)""",
+        *_bus_load_triggers(),
+        *BUS_LOAD_RECOUNT,
+        # confirmed bookings of one departure (package + date) awaiting a bus
+        "CREATE INDEX IF NOT EXISTS idx_bookings_departure ON bookings(package_id, travel_date, status, bus_id)",
+    ]),
+    (6, "trigger-maintained booking_view read model", [
+        """CREATE TABLE IF NOT EXISTS booking_view (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                user_name TEXT,
+                package_id INTEGER,
+                package_name TEXT,
+                bus_id INTEGER,
+                bus_number TEXT,
+                trip_id INTEGER,
+                trip_date DATE,
+                guide_name TEXT,
+                travel_date DATE,
+                payment_method TEXT,
+                status TEXT,
+                created_at TIMESTAMP)""",
+        # per-user dashboard, covering
+        """CREATE INDEX IF NOT EXISTS idx_booking_view_user
+               ON booking_view(user_id, package_name, travel_date, status, payment_method, bus_number)""",
+        "CREATE INDEX IF NOT EXISTS idx_booking_view_status ON booking_view(status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_booking_view_package ON booking_view(package_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_booking_view_bus ON booking_view(bus_id)",
+        "CREATE INDEX IF NOT EXISTS idx_booking_view_created ON booking_view(created_at)",
+        *_booking_view_triggers(),
+        *BOOKING_VIEW_REBUILD,
+    ]),
+    (7, "FTS5 search over support tickets, travellers and packages", [
+        sql for fts, (table, columns) in FTS_INDEXES.items()
+        for sql in _fts_statements(fts, table, columns)
+    ]),
+    (8, "incrementally refreshed analytics summaries", [
+        # the high-water mark scan
+        "CREATE INDEX IF NOT EXISTS idx_bookings_created ON bookings(created_at, travel_date)",
+        """CREATE TABLE IF NOT EXISTS analytics_watermark (
+                source TEXT PRIMARY KEY,
+                created_at TIMESTAMP,
+                last_id INTEGER,
+                refreshed_at TIMESTAMP)""",
+        "CREATE TABLE IF NOT EXISTS analytics_stale (month TEXT NOT NULL PRIMARY KEY) WITHOUT ROWID",
+        """CREATE TABLE IF NOT EXISTS revenue_monthly (
+                month TEXT,
+                package_id INTEGER,
+                bookings INTEGER,
+                confirmed INTEGER,
+                revenue REAL,
+                pipeline REAL,
+                PRIMARY KEY (month, package_id))""",
+        """CREATE TABLE IF NOT EXISTS booking_funnel (
+                month TEXT,
+                status TEXT,
+                n INTEGER,
+                PRIMARY KEY (month, status))""",
+        """CREATE TABLE IF NOT EXISTS payment_mix (
+                month TEXT,
+                payment_method TEXT,
+                bookings INTEGER,
+                revenue REAL,
+                PRIMARY KEY (month, payment_method))""",
+        """CREATE TABLE IF NOT EXISTS trip_occupancy (
+                trip_id INTEGER PRIMARY KEY,
+                month TEXT,
+                package_id INTEGER,
+                trip_date DATE,
+                buses INTEGER,
+                capacity INTEGER,
+                booked INTEGER)""",
+        "CREATE INDEX IF NOT EXISTS idx_trip_occupancy_month ON trip_occupancy(month)",
+        """CREATE TABLE IF NOT EXISTS bus_occupancy (
+                bus_id INTEGER PRIMARY KEY,
+                trip_id INTEGER,
+                month TEXT,
+                capacity INTEGER,
+                seats INTEGER)""",
+        "CREATE INDEX IF NOT EXISTS idx_bus_occupancy_month ON bus_occupancy(month)",
+        *_analytics_triggers(),
+    ]),
+    (9, "monthly activity_log archive segments", [
+        """CREATE TABLE IF NOT EXISTS activity_segments (
+                month TEXT PRIMARY KEY,
+                file TEXT,
+                rows INTEGER,
+                first_id INTEGER,
+                last_id INTEGER,
+                archived_at TIMESTAMP)""",
+    ]),
+    (10, "booking_view update triggers refresh each row once", [
+        *(f"DROP TRIGGER IF EXISTS booking_view_{table}_upd" for table in _BOOKING_VIEW_SOURCES),
+        *(_booking_view_update_trigger(table) for table in _BOOKING_VIEW_SOURCES),
+    ]),
+]
+
+
+def current_version(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn, upto=None):
+    """Apply every pending migration (up to ``upto``), each in its own transaction."""
+    version = current_version(conn)
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        if upto is not None and number > upto:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have applied it while we waited for the lock
+            if conn.execute("SELECT 1 FROM schema_version WHERE version=?", (number,)).fetchone():
+                conn.execute("COMMIT")
+                continue
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                         (number, description))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    return current_version(conn)
+
+
+# ------------------ QUERY PLAN CHECK ------------------ #
+# Readers checked besides db_utils' get_* functions, by module. Names
+# outside db_utils are reported and keyed below as ``module.name``.
+READERS = {
+    "db_utils": ["search", "trip_slots_between", "package_rows", "hotel_rows", "guide_rows",
+                 "trip_rows", "package_ids", "hotel_ids", "guide_ids", "referenced_documents"],
+    "analytics": ["months", "revenue", "occupancy_by_trip", "occupancy_by_bus", "funnel",
+                  "payment_mix", "last_refreshed"],
+    "activity_archive": ["segments", "get_activity"],
+}
+
+# db_utils listing builders: they return (select, where, params, order key)
+# for the admin pages and exports, which are checked as the pages run them.
+LISTINGS = ["bookings_query", "travellers_query", "support_query", "activity_query"]
+
+# Arguments used to exercise readers that take parameters.
+SAMPLE_ARGS = {
+    "get_user_bookings": (1,),
+    "get_user_support": (1,),
+    # a cursor, so the check sees the seek every page after the first uses
+    "get_bookings_page": (10**9,),
+    "get_travellers_page": (10**9,),
+    "get_support_page": (10**9,),
+    "get_activity_page": (10**9,),
+    "get_seats_remaining": (1,),
+    "get_bus_seats_remaining": (1,),
+    "get_trips_between": ("2025-01-01", "2025-03-01"),
+    "get_trip_slot": (1,),
+    "trip_slots_between": ("2025-01-01", "2025-03-01"),
+    "search": ("visa",),
+    "referenced_documents": (["0" * 64],),
+    "analytics.revenue": ("2025-01", "2025-03"),
+    "analytics.occupancy_by_trip": ("2025-01", "2025-03"),
+    "analytics.occupancy_by_bus": ("2025-01", "2025-03"),
+    "analytics.funnel": ("2025-01", "2025-03"),
+    "analytics.payment_mix": ("2025-01", "2025-03"),
+    "activity_archive.get_activity": (1, "2025-01-01", "2025-03-01"),
+}
+
+# Readers that list a whole table on purpose: the driving table may be
+# scanned, every other table in the query must be reached through an index.
+FULL_LISTINGS = {
+    "get_all_packages", "get_travellers", "get_hotels", "get_guides",
+    "get_trips", "get_buses", "get_all_bookings", "get_all_support",
+    "get_dashboard_stats",  # reads the whole (constant-size) stats table
+    "package_rows", "hotel_rows", "guide_rows", "trip_rows",
+    "package_ids", "hotel_ids", "guide_ids",
+    "analytics.months",  # the small per-month summary tables
+    "bookings_query", "travellers_query", "support_query", "activity_query",
+}
+
+
+def _captured_selects(conn, fn, args):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        fn(*args)
+    finally:
+        conn.set_trace_callback(None)  # db_metrics puts its own back on the next cursor
+    return [s for s in statements if s.lstrip().upper().startswith(("SELECT", "WITH"))]
+
+
+def _readers():
+    """(name, function) for every reader check_query_plans() runs."""
+    import importlib
+    import db_utils
+
+    readers = [(name, fn) for name, fn in inspect.getmembers(db_utils, inspect.isfunction)
+               if name.startswith("get_") and fn.__module__ == "db_utils"]
+    for module_name, names in READERS.items():
+        module = importlib.import_module(module_name)
+        prefix = "" if module_name == "db_utils" else f"{module_name}."
+        readers += [(prefix + name, getattr(module, name)) for name in names]
+    return readers
+
+
+def _listing_selects(builder):
+    select, where, params, key = builder()
+    sql = select + (" WHERE " + " AND ".join(where) if where else "") + f" ORDER BY {key}"
+    return [(sql, params)]
+
+
+def check_query_plans():
+    """
+    Run EXPLAIN QUERY PLAN on every query issued by the readers (db_utils'
+    get_* functions, READERS and LISTINGS) and return a list of problems
+    (empty when every access path uses an index).
+    """
+    import db_utils
+    from db_pool import get_connection
+
+    conn = get_connection()
+    problems = []
+    checked = []
+    for name, fn in _readers():
+        required = [p for p in inspect.signature(fn).parameters.values()
+                    if p.default is p.empty and p.kind is p.POSITIONAL_OR_KEYWORD]
+        if required and name not in SAMPLE_ARGS:
+            problems.append(f"{name}: no SAMPLE_ARGS entry, cannot exercise it")
+            continue
+        db_utils.cache.clear()
+        checked += [(name, sql, ()) for sql in _captured_selects(conn, fn, SAMPLE_ARGS.get(name, ()))]
+    for name in LISTINGS:
+        checked += [(name, sql, params) for sql, params in _listing_selects(getattr(db_utils, name))]
+    for name, sql, params in checked:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        scans = [step for step in plan
+                 if step.startswith("SCAN ") and "INDEX" not in step
+                 and "CONSTANT ROW" not in step
+                 and "_fts_" not in step]  # FTS5 reading its own shadow tables
+        allowed = 1 if name in FULL_LISTINGS else 0
+        if len(scans) > allowed:
+            problems.append(f"{name}: full table scan ({'; '.join(scans)})")
+    return problems
+
+
+if __name__ == "__main__":
+    from db_pool import get_connection
+
+    conn = get_connection()
+    print(f"schema version {current_version(conn)}")
+    failed = False
+    if "--check-plans" in sys.argv:
+        problems = check_query_plans()
+        for problem in problems:
+            print(problem)
+        print("query plans OK" if not problems else f"{len(problems)} query plan problem(s)")
+        failed |= bool(problems)
+    if "--rebuild-stats" in sys.argv:
+        import db_utils
+        db_utils.rebuild_stats()
+        print("stats rebuilt")
+    if "--verify-stats" in sys.argv:
+        import db_utils
+        drift = db_utils.verify_stats()
+        for (entity, status), (stored, actual) in drift.items():
+            print(f"{entity}[{status}]: stored {stored}, actual {actual}")
+        print("stats OK" if not drift else f"{len(drift)} counter(s) out of sync")
+        failed |= bool(drift)
+    if "--rebuild-booking-view" in sys.argv:
+        import db_utils
+        db_utils.rebuild_booking_view()
+        print("booking_view rebuilt")
+    if "--verify-booking-view" in sys.argv:
+        import db_utils
+        missing, stale = db_utils.verify_booking_view()
+        print(f"booking_view: {len(missing)} missing/outdated row(s), {len(stale)} stale row(s)"
+              if missing or stale else "booking_view OK")
+        failed |= bool(missing or stale)
+    if "--rebuild-analytics" in sys.argv:
+        import analytics
+        print(f"analytics rebuilt ({len(analytics.rebuild())} months)")
+    if "--verify-analytics" in sys.argv:
+        import analytics
+        analytics.refresh()  # pending months are expected to lag, not drift
+        drift = analytics.verify()
+        for table, (missing, stale) in drift.items():
+            print(f"{table}: {len(missing)} missing/outdated row(s), {len(stale)} stale row(s)")
+        print("analytics OK" if not drift else f"{len(drift)} summary table(s) out of sync")
+        failed |= bool(drift)
+    sys.exit(1 if failed else 0)
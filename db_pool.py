@@ -0,0 +1,174 @@
+"""
+db_pool.py – Shared SQLite connection manager for db_utils and auth.
+
+Every thread uses one connection for all of its queries. Streamlit runs each
+rerun on a new thread, so when a thread exits its connection goes back to an
+idle list and the next new thread takes it from there; a connection is only
+opened (with its PRAGMAs) when none is idle, and is reused across requests
+for the life of the process. Connections run in WAL mode with tuned PRAGMAs,
+the schema is migrated on the first open, and writes go through
+``transaction()`` so each unit of work is a single BEGIN IMMEDIATE … COMMIT.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import db_metrics
+import db_migrations
+
+DB_PATH = os.environ.get("UMRAH_DB", "umrah.db")
+BUSY_TIMEOUT_MS = 5000
+MAX_IDLE = 8  # idle connections kept for new threads; more are closed
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size=-20000",       # ~20 MB page cache
+    "PRAGMA mmap_size=268435456",     # 256 MB memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+)
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_registry = {}  # thread ident -> (thread, connection)
+_idle = []      # connections whose thread has exited
+_schema_ready = False
+
+
+def _open():
+    # isolation_level=None: we issue BEGIN/COMMIT ourselves in transaction()
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000,
+                           isolation_level=None, check_same_thread=False,
+                           factory=db_metrics.MeteredConnection)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _ensure_schema(conn):
+    """Apply pending migrations once per process, on the first connection."""
+    global _schema_ready
+    if not _schema_ready:
+        with _registry_lock:
+            if not _schema_ready:
+                db_migrations.migrate(conn)
+                _schema_ready = True
+
+
+def _reclaim_dead_threads():
+    """Move the connections of threads that have exited to the idle list."""
+    for ident, (thread, conn) in list(_registry.items()):
+        if not thread.is_alive():
+            del _registry[ident]
+            if conn.in_transaction:
+                conn.rollback()  # the thread died inside a transaction()
+            if len(_idle) < MAX_IDLE:
+                _idle.append(conn)
+            else:
+                conn.close()
+
+
+def get_connection():
+    """Return the calling thread's connection: an idle one if any, else a new one."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        with _registry_lock:
+            _reclaim_dead_threads()
+            conn = _idle.pop() if _idle else None
+        if conn is None:
+            conn = _open()
+            _ensure_schema(conn)
+        _local.conn = conn
+        _local.depth = 0
+        _local.after_commit = []
+        with _registry_lock:
+            thread = threading.current_thread()
+            _registry[thread.ident] = (thread, conn)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed statements as one unit of work with a single COMMIT.
+
+    BEGIN IMMEDIATE takes the write lock up front so concurrent writers queue
+    on busy_timeout instead of failing with "database is locked". Every
+    db_utils writer opens its own block, so calling several of them inside
+    ``with transaction():`` makes them commit (or roll back) together. A
+    nested block runs under a SAVEPOINT: if it raises, only its own
+    statements are undone and the caller may catch the error and carry on.
+    """
+    conn = get_connection()
+    if _local.depth:
+        savepoint = f"sp_{_local.depth}"
+        conn.execute(f"SAVEPOINT {savepoint}")
+        _local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+            raise
+        else:
+            conn.execute(f"RELEASE {savepoint}")
+        finally:
+            _local.depth -= 1
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth = 1
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        try:
+            conn.execute("COMMIT")
+        except BaseException:
+            # e.g. SQLITE_BUSY or a full disk: without this the transaction
+            # stays open and every later BEGIN on this connection fails
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        for callback in _local.after_commit:
+            callback()
+    finally:
+        _local.depth = 0
+        _local.after_commit = []
+
+
+def in_transaction():
+    """True while the calling thread is inside a transaction() block."""
+    return bool(getattr(_local, "depth", 0))
+
+
+def call_after_commit(callback):
+    """
+    Run ``callback`` once the current transaction commits, or right away when
+    no transaction is open. Callbacks are dropped on rollback.
+    """
+    if in_transaction():
+        _local.after_commit.append(callback)
+    else:
+        callback()
+
+
+def close_all():
+    """Close every pooled connection (called at interpreter exit)."""
+    with _registry_lock:
+        for _, conn in _registry.values():
+            conn.close()
+        for conn in _idle:
+            conn.close()
+        _registry.clear()
+        _idle.clear()
+    _local.__dict__.clear()
+
+
+atexit.register(close_all)
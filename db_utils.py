@@ -1,216 +1,620 @@
+import re
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+import audit_log
+import db_metrics
+from db_cache import cache, invalidate
+from db_pool import get_connection, transaction, in_transaction, call_after_commit
 
-import sqlite3
-import pandas as pd
+# pandas is imported on first use: pages that only need rows or lookups
+# (see ROW API) never load it.
 
-def get_connection():
-    return sqlite3.connect('umrah.db', check_same_thread=False)
+def _read_sql(sql, params=()):
+    """read_sql_query on the pooled connection, metered when metrics are on."""
+    import pandas as pd
+    with db_metrics.frame():
+        return pd.read_sql_query(sql, get_connection(), params=params)
+
+def _cached_query(sql, tables, params=()):
+    """_read_sql through the shared cache; returns a private copy."""
+    if in_transaction():  # never cache rows other connections can't see yet
+        return _read_sql(sql, params)
+    key = (sql, tuple(params))
+    df = cache.get(key)
+    if df is None:
+        generation = cache.generation(tables)
+        df = _read_sql(sql, params)
+        cache.put(key, tables, df, generation)
+    return df.copy()
+
+def _invalidate(*tables):
+    call_after_commit(lambda: invalidate(*tables))
+
+def _cached_rows(sql, tables, record, params=()):
+    """Rows of ``sql`` as a tuple of ``record`` NamedTuples, through the cache."""
+    if in_transaction():
+        return tuple(map(record._make, get_connection().execute(sql, params)))
+    key = ("rows", sql, tuple(params))
+    rows = cache.get(key)
+    if rows is None:
+        generation = cache.generation(tables)
+        rows = tuple(map(record._make, get_connection().execute(sql, params)))
+        cache.put(key, tables, rows, generation)
+    return rows  # immutable, so shared without copying
+
+def _cached_lookup(sql, tables):
+    """A read-only {name: id} mapping of a two-column ``sql``, through the cache."""
+    if in_transaction():
+        return MappingProxyType(dict(get_connection().execute(sql)))
+    key = ("lookup", sql)
+    lookup = cache.get(key)
+    if lookup is None:
+        generation = cache.generation(tables)
+        lookup = MappingProxyType(dict(get_connection().execute(sql)))
+        cache.put(key, tables, lookup, generation)
+    return lookup
+
+def cache_stats():
+    return cache.stats()
+
+# ------------------ ROW API ------------------ #
+# Typed records for callers that need values, not a table to display. They
+# are plain tuples (no per-row dict) and skip pandas entirely.
+class Package(NamedTuple):
+    id: int
+    name: str
+    price: Optional[float]
+    hotel: Optional[str]
+    duration_days: Optional[int]
+    transport: Optional[str]
+
+class Hotel(NamedTuple):
+    id: int
+    name: str
+    city: Optional[str]
+    rating: Optional[int]
+
+class Guide(NamedTuple):
+    id: int
+    name: str
+    phone: Optional[str]
+    email: Optional[str]
+
+class Trip(NamedTuple):
+    id: int
+    package_id: int
+    trip_date: str
+    price: Optional[float]
+    hotel_id: Optional[int]
+    package_name: str
+    hotel_name: Optional[str]
+
+def package_rows():
+    return _cached_rows("SELECT id, name, price, hotel, duration_days, transport FROM packages ORDER BY id",
+                        ("packages",), Package)
+
+def hotel_rows():
+    return _cached_rows("SELECT id, name, city, rating FROM hotels ORDER BY id", ("hotels",), Hotel)
+
+def guide_rows():
+    return _cached_rows("SELECT id, name, phone, email FROM guides ORDER BY id", ("guides",), Guide)
+
+def trip_rows():
+    return _cached_rows("""
+        SELECT t.id, t.package_id, t.trip_date, t.price, t.hotel_id, p.name, h.name
+        FROM trips t
+        JOIN packages p ON t.package_id = p.id
+        LEFT JOIN hotels h ON t.hotel_id = h.id
+        ORDER BY t.id""", ("trips", "packages", "hotels"), Trip)
+
+# name -> id, for forms that show names and store ids. Names are not unique
+# in packages/guides; as with dict(zip(names, ids)) the last id wins.
+def package_ids():
+    return _cached_lookup("SELECT name, id FROM packages ORDER BY id", ("packages",))
+
+def hotel_ids():
+    return _cached_lookup("SELECT name, id FROM hotels ORDER BY id", ("hotels",))
+
+def guide_ids():
+    return _cached_lookup("SELECT name, id FROM guides ORDER BY id", ("guides",))
+
+# ------------------ UNIT OF WORK ------------------ #
+# ``with db.transaction():`` (re-exported from db_pool) groups any of the
+# writers below, and log_activity, into one atomic commit.
 
 # ------------------ PACKAGES ------------------ #
 def get_all_packages():
-    conn = get_connection()
-    df = pd.read_sql_query('SELECT * FROM packages', conn)
-    conn.close()
-    return df
+    return _cached_query('SELECT * FROM packages', ("packages",))
 
 def add_package(name, price, hotel, duration, transport):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO packages (name, price, hotel, duration_days, transport) VALUES (?, ?, ?, ?, ?)',
-              (name, price, hotel, duration, transport))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("packages")
+        conn.execute('INSERT INTO packages (name, price, hotel, duration_days, transport) VALUES (?, ?, ?, ?, ?)',
+                     (name, price, hotel, duration, transport))
 
 # ------------------ TRAVELLERS (Users List) ------------------ #
 def add_traveller(data):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO travellers (user_id, name, passport_number, nationality, dob, phone, email, emergency_contact, handled_by)
-        VALUES (:user_id, :name, :passport_number, :nationality, :dob, :phone, :email, :emergency_contact, :handled_by)
-    ''', data)
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("travellers")
+        conn.execute('''
+            INSERT INTO travellers (user_id, name, passport_number, nationality, dob, phone, email, emergency_contact, handled_by)
+            VALUES (:user_id, :name, :passport_number, :nationality, :dob, :phone, :email, :emergency_contact, :handled_by)
+        ''', data)
 
 def get_travellers():
-    conn = get_connection()
-    df = pd.read_sql_query('SELECT * FROM travellers', conn)
-    conn.close()
-    return df
+    return _read_sql('SELECT * FROM travellers')
 
 # ------------------ HOTELS ------------------ #
 def add_hotel(name, city, rating):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO hotels (name, city, rating) VALUES (?, ?, ?)', (name, city, rating))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("hotels")
+        conn.execute('INSERT INTO hotels (name, city, rating) VALUES (?, ?, ?)', (name, city, rating))
 
 def get_hotels():
-    conn = get_connection()
-    df = pd.read_sql_query('SELECT * FROM hotels', conn)
-    conn.close()
-    return df
+    return _cached_query('SELECT * FROM hotels', ("hotels",))
 
 # ------------------ GUIDES ------------------ #
 def add_guide(name, phone, email):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO guides (name, phone, email) VALUES (?, ?, ?)', (name, phone, email))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("guides")
+        conn.execute('INSERT INTO guides (name, phone, email) VALUES (?, ?, ?)', (name, phone, email))
 
 def get_guides():
-    conn = get_connection()
-    df = pd.read_sql_query('SELECT * FROM guides', conn)
-    conn.close()
-    return df
+    return _cached_query('SELECT * FROM guides', ("guides",))
 
 # ------------------ TRIPS & BUSES ------------------ #
 def add_trip(package_id, trip_date, price, hotel_id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO trips (package_id, trip_date, price, hotel_id) VALUES (?, ?, ?, ?)',
-              (package_id, trip_date, price, hotel_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("trips")
+        conn.execute('INSERT INTO trips (package_id, trip_date, price, hotel_id) VALUES (?, ?, ?, ?)',
+                     (package_id, trip_date, price, hotel_id))
 
 def get_trips():
-    conn = get_connection()
-    df = pd.read_sql_query("""
+    return _cached_query("""
         SELECT t.*, p.name as package_name, h.name as hotel_name
         FROM trips t
         JOIN packages p ON t.package_id = p.id
         LEFT JOIN hotels h ON t.hotel_id = h.id
-    """, conn)
-    conn.close()
-    return df
+    """, ("trips", "packages", "hotels"))
 
 def add_bus(trip_id, bus_number, capacity, guide_id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO buses (trip_id, bus_number, capacity, guide_id) VALUES (?, ?, ?, ?)',
-              (trip_id, bus_number, capacity, guide_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("buses")
+        conn.execute('INSERT INTO buses (trip_id, bus_number, capacity, guide_id) VALUES (?, ?, ?, ?)',
+                     (trip_id, bus_number, capacity, guide_id))
 
 def get_buses():
-    conn = get_connection()
-    df = pd.read_sql_query('''
+    return _cached_query('''
         SELECT b.*, g.name as guide_name, t.trip_date
         FROM buses b
         LEFT JOIN guides g ON b.guide_id = g.id
         JOIN trips t ON b.trip_id = t.id
-    ''', conn)
-    conn.close()
-    return df
+    ''', ("buses", "guides", "trips"))
 
 # ------------------ BOOKINGS ------------------ #
 def create_booking(user_id, package_id, travel_date, payment_method, bus_id=None):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO bookings (user_id, package_id, travel_date, payment_method, bus_id) VALUES (?, ?, ?, ?, ?)',
-              (user_id, package_id, travel_date, payment_method, bus_id))
-    booking_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return booking_id
+    with transaction() as conn:
+        _invalidate("bookings")
+        c = conn.execute('INSERT INTO bookings (user_id, package_id, travel_date, payment_method, bus_id) VALUES (?, ?, ?, ?, ?)',
+                         (user_id, package_id, travel_date, payment_method, bus_id))
+        return c.lastrowid
 
 def save_booking_file(booking_id, file_path):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO booking_files (booking_id, file_path) VALUES (?, ?)', (booking_id, file_path))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("booking_files")
+        conn.execute('INSERT INTO booking_files (booking_id, file_path) VALUES (?, ?)', (booking_id, file_path))
+
+def save_booking_files(booking_id, stored):
+    """Record every doc_store.store() result for a booking in one transaction."""
+    with transaction() as conn:
+        _invalidate("booking_files")
+        conn.executemany('INSERT INTO booking_files (booking_id, file_path, file_name, sha256, size) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         [(booking_id, f["file_path"], f["file_name"], f["sha256"], f["size"])
+                          for f in stored])
+
+def referenced_documents(digests):
+    """The sha256 digests among ``digests`` that some booking file still points at."""
+    digests = list(digests)
+    if not digests:
+        return set()
+    return {d for (d,) in get_connection().execute(
+        f"SELECT DISTINCT sha256 FROM booking_files WHERE sha256 IN ({', '.join('?' * len(digests))})",
+        digests)}
 
 def get_user_bookings(user_id):
-    conn = get_connection()
-    df = pd.read_sql_query("""
-        SELECT b.id, p.name AS package, b.travel_date, b.status, b.payment_method, bu.bus_number
-        FROM bookings b
-        JOIN packages p ON b.package_id = p.id
-        LEFT JOIN buses bu ON b.bus_id = bu.id
-        WHERE b.user_id = ?
-    """, conn, params=(user_id,))
-    conn.close()
-    return df
+    return _read_sql("""
+        SELECT id, package_name AS package, travel_date, status, payment_method, bus_number
+        FROM booking_view
+        WHERE user_id = ?
+    """, (user_id,))
+
+# Both booking listings read booking_view, the pre-joined read model kept in
+# sync by triggers (migration 6), instead of joining five tables per call.
+_BOOKINGS_SELECT = """
+        SELECT b.id, b.user_name, b.package_name, b.trip_id, b.trip_date, b.travel_date,
+               b.payment_method, b.status, b.bus_number, b.guide_name
+        FROM booking_view b
+"""
 
 def get_all_bookings():
+    return _read_sql(_BOOKINGS_SELECT)
+
+def verify_booking_view():
+    """
+    Compare booking_view with the live join it mirrors. Returns two lists of
+    booking ids: rows missing or outdated in the view, and rows in the view
+    that the join no longer produces.
+    """
+    from db_migrations import BOOKING_VIEW_COLUMNS, BOOKING_VIEW_JOIN
     conn = get_connection()
-    df = pd.read_sql_query(
-        """
-        SELECT b.id,
-               u.name   AS user_name,
-               p.name   AS package_name,
-               t.id     AS trip_id,          -- <-- add!
-               t.trip_date,
-               b.payment_method,
-               b.status,
-               bu.bus_number,
-               g.name   AS guide_name
-        FROM bookings b
-        JOIN users   u  ON b.user_id   = u.id
-        JOIN packages p ON b.package_id = p.id
-        LEFT JOIN buses  bu ON b.bus_id = bu.id
-        LEFT JOIN trips  t  ON bu.trip_id = t.id
-        LEFT JOIN guides g  ON bu.guide_id = g.id
-        """,
-        conn,
-    )
-    conn.close()
-    return df
+    view = f"SELECT {', '.join(BOOKING_VIEW_COLUMNS)} FROM booking_view"
+    missing = [r[0] for r in conn.execute(f"{BOOKING_VIEW_JOIN} EXCEPT {view}")]
+    stale = [r[0] for r in conn.execute(f"{view} EXCEPT {BOOKING_VIEW_JOIN}")]
+    return missing, stale
+
+def rebuild_booking_view():
+    from db_migrations import BOOKING_VIEW_REBUILD
+    with transaction() as conn:
+        for sql in BOOKING_VIEW_REBUILD:
+            conn.execute(sql)
 
 
 def update_booking_status(booking_id, new_status):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('UPDATE bookings SET status=? WHERE id=?', (new_status, booking_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("bookings")
+        conn.execute('UPDATE bookings SET status=? WHERE id=?', (new_status, booking_id))
+
+def update_booking_statuses(booking_ids, new_status):
+    with transaction() as conn:
+        _invalidate("bookings")
+        conn.executemany('UPDATE bookings SET status=? WHERE id=?',
+                         [(new_status, int(i)) for i in booking_ids])
 
 # ------------------ SUPPORT ------------------ #
 def create_support_request(user_id, issue):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO support_requests (user_id, issue) VALUES (?, ?)', (user_id, issue))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("support_requests")
+        conn.execute('INSERT INTO support_requests (user_id, issue) VALUES (?, ?)', (user_id, issue))
 
 def get_user_support(user_id):
-    conn = get_connection()
-    df = pd.read_sql_query('SELECT id, issue, status, created_at FROM support_requests WHERE user_id=?',
-                           conn, params=(user_id,))
-    conn.close()
-    return df
+    return _read_sql('SELECT id, issue, status, created_at FROM support_requests WHERE user_id=?',
+                     (user_id,))
 
 def get_all_support():
-    conn = get_connection()
-    df = pd.read_sql_query('SELECT * FROM support_requests', conn)
-    conn.close()
-    return df
+    return _read_sql('SELECT * FROM support_requests')
 
 def update_support_status(ticket_id, status):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('UPDATE support_requests SET status=? WHERE id=?', (status, ticket_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        _invalidate("support_requests")
+        conn.execute('UPDATE support_requests SET status=? WHERE id=?', (status, ticket_id))
+
+def update_support_statuses(ticket_ids, status):
+    with transaction() as conn:
+        _invalidate("support_requests")
+        conn.executemany('UPDATE support_requests SET status=? WHERE id=?',
+                         [(status, int(i)) for i in ticket_ids])
 
 # ------------------ LOGGING ------------------ #
 def log_activity(user_id, action):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO activity_log (user_id, action) VALUES (?, ?)', (user_id, action))
-    conn.commit()
-    conn.close()
+    """Queue an audit event; audit_log writes it in the background."""
+    audit_log.writer.log(user_id, action)
+
+def log_activities(user_id, actions):
+    audit_log.writer.log_many([(user_id, action) for action in actions])
+
 def update_row(table, row_id: int, fields: dict):
-    conn = get_connection(); c = conn.cursor()
     cols = ", ".join([f"{k}=?" for k in fields.keys()])
-    c.execute(f"UPDATE {table} SET {cols} WHERE id=?", (*fields.values(), row_id))
-    conn.commit(); conn.close()
+    with transaction() as conn:
+        _invalidate(table)
+        conn.execute(f"UPDATE {table} SET {cols} WHERE id=?", (*fields.values(), row_id))
+
+def update_rows(table, changes: dict):
+    """Apply {row_id: {column: value}} with one executemany per column set."""
+    by_columns = {}
+    for row_id, fields in changes.items():
+        by_columns.setdefault(tuple(fields), []).append((*fields.values(), int(row_id)))
+    with transaction() as conn:
+        _invalidate(table)
+        for columns, rows in by_columns.items():
+            cols = ", ".join([f"{k}=?" for k in columns])
+            conn.executemany(f"UPDATE {table} SET {cols} WHERE id=?", rows)
 
 def delete_row(table, row_id: int):
-    conn = get_connection(); conn.execute(f"DELETE FROM {table} WHERE id=?", (row_id,))
-    conn.commit(); conn.close()
+    with transaction() as conn:
+        _invalidate(table)
+        conn.execute(f"DELETE FROM {table} WHERE id=?", (row_id,))
+
+# ------------------ DASHBOARD STATS ------------------ #
+# Counters in the ``stats`` table are kept exact by triggers (migration 3),
+# so the dashboard reads a handful of rows instead of counting tables.
+def get_dashboard_stats():
+    rows = get_connection().execute("SELECT entity, status, n FROM stats").fetchall()
+    by_entity = {}
+    for entity, status, n in rows:
+        by_entity.setdefault(entity, {})[status] = n
+    bookings = by_entity.get("bookings", {})
+    support = by_entity.get("support_requests", {})
+    return {
+        "trips": sum(by_entity.get("trips", {}).values()),
+        "travellers": sum(by_entity.get("travellers", {}).values()),
+        "bookings": sum(bookings.values()),
+        "bookings_by_status": bookings,
+        "open_tickets": support.get("Pending", 0),
+        "support_by_status": support,
+    }
+
+def _recount_stats(conn):
+    from db_migrations import BUS_LOAD_RECOUNT_SQL, STATS_TABLES, stats_recount_sql
+    actual = {}
+    for table, status in STATS_TABLES.items():
+        for entity, key, n in conn.execute(stats_recount_sql(table, status)):
+            actual[(entity, key)] = n
+    for bus_id, n in conn.execute(BUS_LOAD_RECOUNT_SQL):
+        actual[("bus_load", bus_id)] = n
+    return actual
+
+def verify_stats():
+    """Return {(entity, status): (stored, actual)} for every counter that drifted."""
+    conn = get_connection()
+    stored = {(e, k): n for e, k, n in conn.execute("SELECT entity, status, n FROM stats")}
+    stored.update({("bus_load", b): n for b, n in conn.execute("SELECT bus_id, seats FROM bus_load")})
+    actual = _recount_stats(conn)
+    return {key: (stored.get(key, 0), actual.get(key, 0))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key, 0) != actual.get(key, 0)}
+
+def rebuild_stats():
+    from db_migrations import BUS_LOAD_RECOUNT, STATS_RECOUNT
+    with transaction() as conn:
+        for sql in STATS_RECOUNT + BUS_LOAD_RECOUNT:
+            conn.execute(sql)
+
+# ------------------ SEAT ALLOCATION ------------------ #
+# bus_load (migration 5) holds the seats taken on every bus, kept exact by
+# triggers, so remaining capacity is a primary-key lookup.
+def get_bus_seats_remaining(bus_id):
+    row = get_connection().execute("""
+        SELECT b.capacity - COALESCE(l.seats, 0)
+        FROM buses b LEFT JOIN bus_load l ON l.bus_id = b.id
+        WHERE b.id = ?""", (bus_id,)).fetchone()
+    return row[0] if row else None
+
+def get_seats_remaining(trip_id):
+    return _read_sql("""
+        SELECT b.id AS bus_id, b.bus_number, b.capacity,
+               COALESCE(l.seats, 0) AS seats_taken,
+               b.capacity - COALESCE(l.seats, 0) AS seats_remaining
+        FROM buses b LEFT JOIN bus_load l ON l.bus_id = b.id
+        WHERE b.trip_id = ?
+        ORDER BY b.id""", (trip_id,))
+
+def _plan_allocation(groups, free):
+    """
+    Assign booking groups (lists of booking ids) to buses ({bus_id: free seats}).
+    Largest groups go first, each into the fullest bus that still fits it
+    whole; a group larger than any bus's free space is split across the
+    emptiest buses. Returns ([(bus_id, booking_id)], [unplaced booking ids]).
+    An overbooked bus (negative free seats) counts as full:
+
+    >>> _plan_allocation([[1, 2, 3]], {10: -2, 11: -1})
+    ([], [1, 2, 3])
+    """
+    free = {bus: max(0, seats) for bus, seats in free.items()}
+    assignments, unplaced = [], []
+    for group in sorted(groups, key=lambda g: (-len(g), g[0])):
+        fits = [bus for bus, seats in free.items() if seats >= len(group)]
+        if fits:
+            bus = min(fits, key=lambda b: (free[b], b))
+            assignments += [(bus, booking) for booking in group]
+            free[bus] -= len(group)
+            continue
+        for booking in group:
+            bus = max(free, key=lambda b: (free[b], -b), default=None)
+            if bus is None or free[bus] <= 0:
+                unplaced.append(booking)
+                continue
+            assignments.append((bus, booking))
+            free[bus] -= 1
+    return assignments, unplaced
+
+def allocate_trip(trip_id):
+    """
+    Seat every confirmed booking of a trip's departure (same package and
+    date) that has no bus yet, keeping bookings made by the same user on
+    one bus. Runs as one transaction with a single bulk UPDATE.
+    """
+    with transaction() as conn:
+        _invalidate("bookings")
+        trip = conn.execute("SELECT package_id, trip_date FROM trips WHERE id = ?", (trip_id,)).fetchone()
+        if trip is None:
+            raise ValueError(f"unknown trip {trip_id}")
+        free = {bus: seats for bus, seats in conn.execute("""
+            SELECT b.id, b.capacity - COALESCE(l.seats, 0)
+            FROM buses b LEFT JOIN bus_load l ON l.bus_id = b.id
+            WHERE b.trip_id = ?""", (trip_id,))}
+        groups = {}
+        for booking, user in conn.execute("""
+                SELECT id, user_id FROM bookings
+                WHERE package_id = ? AND travel_date = ? AND status = 'Confirmed' AND bus_id IS NULL
+                ORDER BY id""", trip):
+            groups.setdefault(user, []).append(booking)
+        assignments, unplaced = _plan_allocation(list(groups.values()), free)
+        conn.executemany("UPDATE bookings SET bus_id = ? WHERE id = ?", assignments)
+    return {"assigned": len(assignments), "unassigned": unplaced}
+
+# ------------------ TRIP CALENDAR ------------------ #
+# Trips departing in a date window, with occupancy computed in SQL: the
+# window is a range seek on idx_trips_date(trip_date, package_id), capacity
+# sums the trip's buses (idx_buses_trip) and bookings are counted per
+# departure on idx_bookings_departure, so no query touches the full history.
+class TripSlot(NamedTuple):
+    id: int
+    trip_date: str
+    package_id: int
+    package_name: str
+    hotel_name: Optional[str]
+    price: Optional[float]
+    capacity: int
+    booked: int
+    seats_available: int
+
+_TRIP_SLOTS_SQL = """
+    SELECT id, trip_date, package_id, package_name, hotel_name, price, capacity, booked,
+           capacity - booked AS seats_available
+    FROM (
+        SELECT t.id, t.trip_date, t.package_id, p.name AS package_name, h.name AS hotel_name,
+               t.price,
+               (SELECT COALESCE(SUM(b.capacity), 0) FROM buses b WHERE b.trip_id = t.id) AS capacity,
+               (SELECT COUNT(*) FROM bookings k
+                WHERE k.package_id = t.package_id AND k.travel_date = t.trip_date
+                  AND k.status != 'Cancelled') AS booked
+        FROM trips t
+        JOIN packages p ON p.id = t.package_id
+        LEFT JOIN hotels h ON h.id = t.hotel_id
+        WHERE {where}
+    )
+    ORDER BY trip_date, id"""
+
+def _trips_between(start, end, package_id):
+    where, params = "t.trip_date BETWEEN ? AND ?", [str(start), str(end)]
+    if package_id is not None:
+        where += " AND t.package_id = ?"
+        params.append(int(package_id))
+    return _TRIP_SLOTS_SQL.format(where=where), tuple(params)
+
+def get_trips_between(start, end, package_id=None):
+    """Trips departing from ``start`` to ``end`` (inclusive) with their occupancy."""
+    sql, params = _trips_between(start, end, package_id)
+    return _cached_query(sql, ("trips", "packages", "hotels", "buses", "bookings"), params)
+
+def trip_slots_between(start, end, package_id=None):
+    """get_trips_between as TripSlot rows, read fresh (for booking decisions)."""
+    sql, params = _trips_between(start, end, package_id)
+    return [TripSlot._make(row) for row in get_connection().execute(sql, params)]
+
+def get_trip_slot(trip_id):
+    """One trip's TripSlot or None; inside the booking transaction it re-checks seats."""
+    row = get_connection().execute(_TRIP_SLOTS_SQL.format(where="t.id = ?"), (trip_id,)).fetchone()
+    return TripSlot._make(row) if row else None
+
+# ------------------ SEARCH ------------------ #
+# Ranked full-text search over the FTS5 indexes from migration 7.
+SEARCH_PAGE_SIZE = 20
+
+SEARCH_SCOPES = {
+    "support": """
+        SELECT 'support' AS scope, s.id, 'Ticket #' || s.id || ' (' || s.status || ')' AS title,
+               snippet(support_fts, -1, '**', '**', '…', 12) AS snippet, bm25(support_fts) AS rank
+        FROM support_fts JOIN support_requests s ON s.id = support_fts.rowid
+        WHERE support_fts MATCH ?""",
+    "travellers": """
+        SELECT 'travellers' AS scope, t.id, t.name || ' (' || COALESCE(t.passport_number, '') || ')' AS title,
+               snippet(travellers_fts, -1, '**', '**', '…', 12) AS snippet, bm25(travellers_fts) AS rank
+        FROM travellers_fts JOIN travellers t ON t.id = travellers_fts.rowid
+        WHERE travellers_fts MATCH ?""",
+    "packages": """
+        SELECT 'packages' AS scope, p.id, p.name AS title,
+               snippet(packages_fts, -1, '**', '**', '…', 12) AS snippet, bm25(packages_fts) AS rank
+        FROM packages_fts JOIN packages p ON p.id = packages_fts.rowid
+        WHERE packages_fts MATCH ?""",
+}
+
+def _fts_query(text):
+    """Turn free text into an FTS5 query: every word, as a prefix, must match."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+def search(query, scopes=tuple(SEARCH_SCOPES), limit=SEARCH_PAGE_SIZE, offset=0):
+    """Best matches first across ``scopes``; returns scope, id, title, snippet, rank."""
+    match = _fts_query(query or "")
+    if not match or not scopes:
+        import pandas as pd
+        return pd.DataFrame(columns=["scope", "id", "title", "snippet", "rank"])
+    sql = " UNION ALL ".join(SEARCH_SCOPES[s] for s in scopes) + " ORDER BY rank LIMIT ? OFFSET ?"
+    return _read_sql(sql, (*[match] * len(scopes), limit, offset))
+
+# ------------------ FILTERED LISTINGS ------------------ #
+# Each *_query builder returns (select, where, params, key) for an admin
+# listing with its filters pushed into SQL. The *_page readers below and
+# bulk_export both build on them.
+def _date_range(column, start, end, where, params):
+    if start is not None:
+        where.append(f"{column} >= ?")
+        params.append(str(start))
+    if end is not None:
+        where.append(f"{column} < date(?, '+1 day')")
+        params.append(str(end))
+
+def bookings_query(status=None, start=None, end=None, package_id=None, search=None):
+    where, params = [], []
+    if status:
+        where.append("b.status = ?"); params.append(status)
+    if package_id is not None:
+        where.append("b.package_id = ?"); params.append(int(package_id))
+    _date_range("b.created_at", start, end, where, params)
+    if search:
+        where.append("(b.user_name LIKE ? OR b.package_name LIKE ? OR b.payment_method LIKE ?)")
+        params += [f"%{search}%"] * 3
+    return _BOOKINGS_SELECT, where, params, "b.id"
+
+def travellers_query(start=None, end=None, search=None):
+    where, params = [], []
+    _date_range("created_at", start, end, where, params)
+    if search:
+        where.append("(name LIKE ? OR passport_number LIKE ? OR email LIKE ? OR phone LIKE ?)")
+        params += [f"%{search}%"] * 4
+    return "SELECT * FROM travellers", where, params, "id"
+
+def support_query(status=None, start=None, end=None, search=None, user_id=None):
+    where, params = [], []
+    if status:
+        where.append("status = ?"); params.append(status)
+    if user_id is not None:
+        where.append("user_id = ?"); params.append(user_id)
+    _date_range("created_at", start, end, where, params)
+    if search:
+        where.append("issue LIKE ?"); params.append(f"%{search}%")
+    return "SELECT * FROM support_requests", where, params, "id"
+
+def activity_query(user_id=None, start=None, end=None, search=None):
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?"); params.append(user_id)
+    _date_range("timestamp", start, end, where, params)
+    if search:
+        where.append("action LIKE ?"); params.append(f"%{search}%")
+    return "SELECT * FROM activity_log", where, params, "id"
+
+# ------------------ PAGINATION ------------------ #
+# Keyset (seek) pagination, newest first: pass the cursor returned with one
+# page as ``after`` to get the next. Cursors are row ids, so every page is an
+# index seek no matter how deep into the history it is.
+PAGE_SIZE = 50
+
+def _page(query, after, limit):
+    sql, where, params, key = query
+    where, params = list(where), list(params)
+    if after is not None:
+        where.append(f"{key} < ?")
+        params.append(after)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {key} DESC LIMIT ?"
+    df = _read_sql(sql, (*params, limit + 1))
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        return df, int(df["id"].iat[-1])
+    return df, None
+
+def get_bookings_page(after=None, limit=PAGE_SIZE, **filters):
+    """One page of the admin bookings listing; returns (df, next_cursor)."""
+    return _page(bookings_query(**filters), after, limit)
+
+def get_travellers_page(after=None, limit=PAGE_SIZE, **filters):
+    return _page(travellers_query(**filters), after, limit)
+
+def get_support_page(after=None, limit=PAGE_SIZE, **filters):
+    return _page(support_query(**filters), after, limit)
 
-def get_connection():  # keep as-is, just reminder
-    return sqlite3.connect("umrah.db", check_same_thread=False)
+def get_activity_page(after=None, limit=PAGE_SIZE, **filters):
+    return _page(activity_query(**filters), after, limit)
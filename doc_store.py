@@ -0,0 +1,67 @@
+"""
+doc_store.py – Content-addressed storage for booking documents.
+
+Uploads are streamed to disk in CHUNK_BYTES pieces and hashed on the fly.
+Each file ends up at upload/<h[:2]>/<h[2:4]>/<sha256>, so a scan uploaded for
+several bookings is stored once. Writes run on a small thread pool.
+"""
+
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+UPLOAD_DIR = os.environ.get("UMRAH_UPLOAD_DIR", "upload")
+CHUNK_BYTES = 1 << 20  # 1 MiB
+MAX_WORKERS = 4
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="doc-store")
+
+
+def path_for(digest):
+    return os.path.join(UPLOAD_DIR, digest[:2], digest[2:4], digest)
+
+
+def store(fileobj, name=None):
+    """
+    Stream ``fileobj`` into the store and return a dict with its ``file_name``,
+    ``sha256``, ``size`` and ``file_path``.
+    """
+    name = name or getattr(fileobj, "name", None)
+    tmp_dir = os.path.join(UPLOAD_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest, size = hashlib.sha256(), 0
+    if hasattr(fileobj, "seek"):
+        fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+        try:
+            for chunk in iter(lambda: fileobj.read(CHUNK_BYTES), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    digest = digest.hexdigest()
+    path = path_for(digest)
+    if os.path.exists(path):
+        os.remove(tmp.name)  # same bytes already stored
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp.name, path)
+    return {"file_name": name, "sha256": digest, "size": size, "file_path": path}
+
+
+def store_all(files):
+    """Store every file concurrently on the pool; results keep input order."""
+    return list(_pool.map(store, files))
+
+
+def discard(stored):
+    """Delete the files of store() results, e.g. the uploads of a booking that failed."""
+    for result in stored:
+        try:
+            os.remove(result["file_path"])
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,73 @@
+"""
+passwords.py – Salted password hashing on a bounded worker pool.
+
+Hashes are PBKDF2-HMAC-SHA256 stored as
+``pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>``. The caller waits for
+its own hash either way; the work runs on a pool of HASH_WORKERS threads
+only to bound how many hashes run at once, so a burst of logins queues for
+the pool instead of oversubscribing the CPU. (hashlib releases the GIL
+while it derives a key, which is what lets other sessions keep running.)
+
+Hashes made with fewer than PBKDF2_ITERATIONS iterations, and legacy
+unsalted SHA-256 hex digests, still verify but report that they need a
+rehash, so raising the cost (UMRAH_PBKDF2_ITERATIONS) upgrades every
+account on its next login.
+"""
+
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+PBKDF2_ITERATIONS = int(os.environ.get("UMRAH_PBKDF2_ITERATIONS", 600_000))
+HASH_WORKERS = int(os.environ.get("UMRAH_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+SALT_BYTES = 16
+SCHEME = "pbkdf2_sha256"
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_dummy = None
+
+
+def _derive(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations).hex()
+
+
+def _hash(password, iterations):
+    salt = os.urandom(SALT_BYTES)
+    return f"{SCHEME}${iterations}${salt.hex()}${_derive(password, salt, iterations)}"
+
+
+def _check(password, stored):
+    if not isinstance(stored, str) or not stored.isascii():
+        return False, False  # compare_digest only takes ASCII strings
+    if stored.startswith(SCHEME + "$"):
+        try:
+            _, iterations, salt, digest = stored.split("$")
+            iterations, salt = int(iterations), bytes.fromhex(salt)
+            if iterations < 1:
+                raise ValueError(iterations)
+        except ValueError:
+            return False, False  # a corrupt hash matches nothing
+        ok = hmac.compare_digest(_derive(password, salt, iterations), digest)
+        return ok, ok and iterations < PBKDF2_ITERATIONS
+    # legacy: unsalted SHA-256
+    ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    return ok, ok
+
+
+def hash_password(password, iterations=None):
+    """A new salted hash of ``password``."""
+    return _pool.submit(_hash, password, iterations or PBKDF2_ITERATIONS).result()
+
+
+def verify_password(password, stored):
+    """(matches, needs_rehash) for ``password`` against the ``stored`` hash."""
+    return _pool.submit(_check, password, stored).result()
+
+
+def burn(password):
+    """Spend the time of a real check, so an unknown account is not faster to reject."""
+    global _dummy
+    if _dummy is None:
+        _dummy = hash_password("")
+    verify_password(password, _dummy)
@@ -2,14 +2,17 @@
 main_app.py – One-page, role-aware Umrah portal with full admin CRUD.
 """
 
-from datetime import date
-import pandas as pd
+from datetime import date, timedelta
 import streamlit as st
 import db_utils as db
+import db_metrics
 from auth import login_form, registration_form, logout, is_admin, get_user_info
+from admin_ui import (Loader, sections, paged, filter_bar, status_grid, search_panel,
+                      import_panel, export_panel, reports_panel, performance_panel, BOOKING_STATUSES, SUPPORT_STATUSES)
 
 # ───────────────────── CONFIG / THEME ─────────────────────
 st.set_page_config(page_title="Umrah Portal", page_icon="🕋", layout="wide")
+db_metrics.begin_run("test.py")
 st.markdown("""
 <style>
 body{font-family:'Segoe UI',Tahoma,sans-serif;}
@@ -38,33 +41,43 @@ role = st.session_state.get("role_id")  # None / 2 / 1
 # One page – choose tab set based on role
 if role == 1:  # ───────────── ADMIN ─────────────
     st.title("Admin Control Panel")
+    with st.expander("🔍 Search"):
+        search_panel()
 
-    main_tabs = st.tabs([
-        "📊 Overview", "📦 Packages", "🚌 Trips/Buses", "🧳 Travellers",
-        "🏨 Hotels", "🧭 Guides", "🎟️ Bookings", "🆘 Support"
-    ])
+    # each section lists the data it needs; only the active one is loaded,
+    # and a dependency shared by several forms is fetched once per rerun
+    data = Loader(stats=db.get_dashboard_stats, packages=db.get_all_packages, trips=db.get_trips,
+                  buses=db.get_buses, hotels=db.get_hotels, guides=db.get_guides,
+                  trip_rows=db.trip_rows, package_ids=db.package_ids, hotel_ids=db.hotel_ids,
+                  guide_ids=db.guide_ids,
+                  upcoming=lambda: db.get_trips_between(date.today(), date.today() + timedelta(days=60)))
+    section = sections("admin", {
+        "📊 Overview": ["stats", "upcoming"], "📦 Packages": ["packages", "package_ids"],
+        "🚌 Trips/Buses": [], "🧳 Travellers": [], "🏨 Hotels": ["hotels"],
+        "🧭 Guides": ["guides"], "🎟️ Bookings": ["package_ids"], "🆘 Support": [],
+        "📥 Import": [], "📤 Export": [], "📈 Reports": [], "⏱️ Performance": [],
+    }, data)
 
     # ---------- 1. OVERVIEW ----------
-    with main_tabs[0]:
-        trips = db.get_trips(); trips["trip_date"] = pd.to_datetime(trips["trip_date"]).dt.date
-        st.metric("Trips", len(trips))
-        st.metric("Travellers", len(db.get_travellers()))
-        st.metric("Bookings", len(db.get_all_bookings()))
-        st.metric("Open Tickets", len(db.get_all_support().query("status=='Pending'")))
+    if section == "📊 Overview":
+        stats = data.stats
+        st.metric("Trips", stats["trips"])
+        st.metric("Travellers", stats["travellers"])
+        st.metric("Bookings", stats["bookings"])
+        st.metric("Open Tickets", stats["open_tickets"])
         st.divider(); st.subheader("Upcoming 60 days")
-        st.dataframe(trips[trips.trip_date.between(date.today(),
-                        date.today()+pd.Timedelta(days=60))])
+        st.dataframe(data.upcoming)
 
     # ---------- 2. PACKAGES (CRUD) ----------
-    with main_tabs[1]:
+    elif section == "📦 Packages":
         st.subheader("Package Catalogue")
-        df = db.get_all_packages(); st.dataframe(df, use_container_width=True)
+        df = data.packages; st.dataframe(df, use_container_width=True)
         st.markdown("### ➕ Add / ✏️ Edit / 🗑️ Delete")
         with st.form("pkg_form"):
             mode = st.radio("Mode", ["Add", "Edit", "Delete"], horizontal=True)
             if mode != "Add":
-                sel = st.selectbox("Select package", df["name"])
-                pkg_id = int(df.loc[df.name == sel, "id"])
+                sel = st.selectbox("Select package", list(data.package_ids))
+                pkg_id = data.package_ids[sel]
             name = st.text_input("Name")
             price = st.number_input("Price", min_value=100.0)
             hotel = st.text_input("Hotel")
@@ -72,77 +85,108 @@ if role == 1:  # ───────────── ADMIN ─────
             trans = st.text_input("Transport")
             submit = st.form_submit_button("Save")
             if submit:
-                if mode == "Add":
-                    db.add_package(name, price, hotel, dur, trans)
-                elif mode == "Edit":
-                    db.update_row("packages", pkg_id,
-                                  {"name": name, "price": price, "hotel": hotel,
-                                   "duration_days": dur, "transport": trans})
-                else:
-                    db.delete_row("packages", pkg_id)
+                with db.transaction():  # change + audit entry in one commit
+                    if mode == "Add":
+                        db.add_package(name, price, hotel, dur, trans)
+                    elif mode == "Edit":
+                        db.update_row("packages", pkg_id,
+                                      {"name": name, "price": price, "hotel": hotel,
+                                       "duration_days": dur, "transport": trans})
+                    else:
+                        db.delete_row("packages", pkg_id)
+                    db.log_activity(st.session_state.user_id, f"{mode} package {name}")
                 st.success(f"Package {mode.lower()}ed."); st.experimental_rerun()
 
     # ---------- 3. TRIPS & BUSES ----------
-    with main_tabs[2]:
-        tsub = st.tabs(["Trips", "Buses"])
+    elif section == "🚌 Trips/Buses":
+        sub = sections("trips", {"Trips": ["trips", "trip_rows", "package_ids", "hotel_ids"],
+                                 "Buses": ["buses", "trip_rows", "guide_ids"]}, data)
         # Trips CRUD
-        with tsub[0]:
-            tdf = db.get_trips(); st.dataframe(tdf)
+        if sub == "Trips":
+            tdf = data.trips; st.dataframe(tdf)
             with st.form("trip_form"):
                 mode = st.radio("Mode", ["Add", "Edit", "Delete"], horizontal=True)
                 if mode != "Add":
-                    trip_key = st.selectbox("Trip", tdf.id)
-                pkg_df = db.get_all_packages()
-                pkg_name = st.selectbox("Package", pkg_df.name)
+                    trip_key = st.selectbox("Trip", [t.id for t in data.trip_rows])
+                pkg_name = st.selectbox("Package", list(data.package_ids))
                 trip_date = st.date_input("Trip Date")
                 price = st.number_input("Price", min_value=100.0)
-                hotel_df = db.get_hotels(); hotel = st.selectbox("Hotel", hotel_df.name)
+                hotel = st.selectbox("Hotel", list(data.hotel_ids))
                 if st.form_submit_button("Save"):
-                    if mode == "Add":
-                        db.add_trip(pkg_df.loc[pkg_df.name==pkg_name,"id"].iat[0],
-                                    trip_date, price,
-                                    hotel_df.loc[hotel_df.name==hotel,"id"].iat[0])
-                    elif mode == "Edit":
-                        db.update_row("trips", trip_key,
-                                      {"package_id": pkg_df.loc[pkg_df.name==pkg_name,"id"].iat[0],
-                                       "trip_date": trip_date, "price": price,
-                                       "hotel_id": hotel_df.loc[hotel_df.name==hotel,"id"].iat[0]})
-                    else:
-                        db.delete_row("trips", trip_key)
+                    with db.transaction():  # change + audit entry in one commit
+                        if mode == "Add":
+                            db.add_trip(data.package_ids[pkg_name], trip_date, price,
+                                        data.hotel_ids[hotel])
+                        elif mode == "Edit":
+                            db.update_row("trips", trip_key,
+                                          {"package_id": data.package_ids[pkg_name],
+                                           "trip_date": trip_date, "price": price,
+                                           "hotel_id": data.hotel_ids[hotel]})
+                        else:
+                            db.delete_row("trips", trip_key)
+                        db.log_activity(st.session_state.user_id, f"{mode} trip {trip_date}")
                     st.success("Saved."); st.experimental_rerun()
         # Buses CRUD
-        with tsub[1]:
-            bdf = db.get_buses(); st.dataframe(bdf)
+        else:
+            bdf = data.buses; st.dataframe(bdf)
             with st.form("bus_form"):
                 mode = st.radio("Mode", ["Add","Edit","Delete"], key="bus_mode",horizontal=True)
                 if mode != "Add":
-                    sel = st.selectbox("Bus ID", bdf.id)
-                trip_df = db.get_trips(); trip = st.selectbox("Trip", trip_df.id)
+                    sel = st.selectbox("Bus ID", [int(i) for i in bdf.id])
+                trip_ids = [t.id for t in data.trip_rows]; trip = st.selectbox("Trip", trip_ids)
                 bus_no = st.text_input("Bus Number")
                 cap = st.number_input("Capacity", min_value=1)
-                guide_df = db.get_guides(); guide = st.selectbox("Guide", guide_df.name)
+                guide = st.selectbox("Guide", list(data.guide_ids))
                 if st.form_submit_button("Save Bus"):
-                    if mode == "Add":
-                        db.add_bus(trip, bus_no, cap, guide_df.loc[guide_df.name==guide,"id"].iat[0])
-                    elif mode == "Edit":
-                        db.update_row("buses", sel, {"trip_id":trip,"bus_number":bus_no,
-                                                     "capacity":cap,
-                                                     "guide_id":guide_df.loc[guide_df.name==guide,'id'].iat[0]})
-                    else:
-                        db.delete_row("buses", sel)
+                    with db.transaction():  # change + audit entry in one commit
+                        if mode == "Add":
+                            db.add_bus(trip, bus_no, cap, data.guide_ids[guide])
+                        elif mode == "Edit":
+                            db.update_row("buses", sel, {"trip_id":trip,"bus_number":bus_no,
+                                                         "capacity":cap,
+                                                         "guide_id":data.guide_ids[guide]})
+                        else:
+                            db.delete_row("buses", sel)
+                        db.log_activity(st.session_state.user_id, f"{mode} bus {bus_no}")
                     st.success("Bus saved."); st.experimental_rerun()
+            st.markdown("### 🪑 Seat Allocation")
+            alloc_trip = st.selectbox("Trip", trip_ids, key="alloc_trip")
+            if alloc_trip is not None:
+                st.dataframe(db.get_seats_remaining(alloc_trip))
+                if st.button("Allocate confirmed bookings", key="alloc_run"):
+                    result = db.allocate_trip(alloc_trip)
+                    db.log_activity(st.session_state.user_id,
+                                    f"Allocated {result['assigned']} bookings on trip {alloc_trip}")
+                    st.success(f"{result['assigned']} bookings seated.")
+                    if result["unassigned"]:
+                        st.warning(f"No seat left for bookings {result['unassigned']}.")
 
     # ---------- 4. TRAVELLERS CRUD ----------
-    with main_tabs[3]:
+    elif section == "🧳 Travellers":
         st.subheader("Travellers")
-        trav = db.get_travellers(); st.dataframe(trav)
+        trav = paged("travellers", db.get_travellers_page, **filter_bar("travellers"))
+        st.dataframe(trav)
         # similar CRUD pattern could be added here …
 
     # ---------- 5/6/7/8. HOTELS, GUIDES, BOOKINGS, SUPPORT ----------
-    with main_tabs[4]: st.dataframe(db.get_hotels())
-    with main_tabs[5]: st.dataframe(db.get_guides())
-    with main_tabs[6]: st.dataframe(db.get_all_bookings())
-    with main_tabs[7]: st.dataframe(db.get_all_support())
+    elif section == "🏨 Hotels": st.dataframe(data.hotels)
+    elif section == "🧭 Guides": st.dataframe(data.guides)
+    elif section == "🎟️ Bookings":
+        filters = filter_bar("bookings", statuses=BOOKING_STATUSES, packages=data.package_ids)
+        status_grid("bookings", paged("bookings", db.get_bookings_page, **filters),
+                    "bookings", "booking", BOOKING_STATUSES, st.session_state.user_id)
+    elif section == "🆘 Support":
+        filters = filter_bar("support", statuses=SUPPORT_STATUSES)
+        status_grid("support", paged("support", db.get_support_page, **filters),
+                    "support_requests", "ticket", SUPPORT_STATUSES, st.session_state.user_id)
+    elif section == "📥 Import":
+        import_panel(st.session_state.user_id)
+    elif section == "📤 Export":
+        export_panel(st.session_state.user_id)
+    elif section == "📈 Reports":
+        reports_panel()
+    else:
+        performance_panel()
 
 # ───────────── USER ROLE (role_id = 2) ─────────────
 elif role == 2:
@@ -2,11 +2,15 @@
 import streamlit as st
 from auth import login_form, registration_form, logout, is_admin, get_user_info
 from db_utils import *
-from datetime import date
-import os
+from admin_ui import (Loader, sections, paged, filter_bar, status_grid, search_panel,
+                      reports_panel, performance_panel, BOOKING_STATUSES, SUPPORT_STATUSES)
+from datetime import date, timedelta
+import db_metrics
+import doc_store
 
 # Streamlit config
 st.set_page_config(page_title="Umrah Travel Agency", page_icon="🕋", layout="wide")
+db_metrics.begin_run("umrah.py")
 
 # Sidebar
 st.sidebar.title("Umrah Portal")
@@ -27,6 +31,7 @@ if st.session_state.get("show_register"):
 
 # Navigation
 menu = st.sidebar.radio("Navigate", ["🏠 Home", "📦 Packages", "📝 Book", "📋 Dashboard", "🆘 Support"] + (["⚙️ Admin"] if is_admin() else []))
+db_metrics.set_page(menu)
 
 # Home
 if menu == "🏠 Home":
@@ -49,26 +54,37 @@ elif menu == "📝 Book":
         st.stop()
 
     st.header("Book an Umrah Package")
-    packages = get_all_packages()
-    package_map = dict(zip(packages['name'], packages['id']))
-    selected = st.selectbox("Choose a package", list(package_map.keys()))
-
-    travel_date = st.date_input("Travel Date", min_value=date.today())
+    package_map = package_ids()
+    selected = st.selectbox("Choose a package", list(package_map))
+
+    # only departures in the coming year that still have seats
+    slots = [t for t in trip_slots_between(date.today(), date.today() + timedelta(days=365), package_map[selected])
+             if t.seats_available > 0]
+    if not slots:
+        st.info("No upcoming departures with free seats for this package.")
+    trip = st.selectbox("Travel Date", slots,
+                        format_func=lambda t: f"{t.trip_date} · {t.seats_available} seats left")
     payment_method = st.selectbox("Payment Method", ["Credit Card", "Bank Transfer", "Cash"])
     documents = st.file_uploader("Upload Documents (PDF/Image)", accept_multiple_files=True)
 
-    if st.button("Confirm Booking"):
-        booking_id = create_booking(st.session_state.user_id, package_map[selected], travel_date, payment_method)
-
-        os.makedirs("upload", exist_ok=True)
-        for doc in documents:
-            path = f"upload/{booking_id}_{doc.name}"
-            with open(path, "wb") as f:
-                f.write(doc.read())
-            save_booking_file(booking_id, path)
-
-        log_activity(st.session_state.user_id, f"Created booking {booking_id}")
-        st.success("Booking submitted successfully.")
+    if st.button("Confirm Booking", disabled=not slots):
+        stored = doc_store.store_all(documents or [])
+        with transaction():  # booking, its files and the audit entry commit together
+            # re-check under the write lock: the last seat may have gone since the page loaded
+            slot = get_trip_slot(trip.id)
+            booking_id = None
+            if slot is not None and slot.seats_available > 0:
+                booking_id = create_booking(st.session_state.user_id, package_map[selected], slot.trip_date, payment_method)
+                save_booking_files(booking_id, stored)
+                log_activity(st.session_state.user_id, f"Created booking {booking_id}")
+            else:
+                # no booking to attach them to: drop the uploads no other booking shares
+                shared = referenced_documents(f["sha256"] for f in stored)
+                doc_store.discard([f for f in stored if f["sha256"] not in shared])
+        if booking_id is None:
+            st.error("That departure has just sold out, please pick another date.")
+        else:
+            st.success("Booking submitted successfully.")
 
 # Dashboard
 elif menu == "📋 Dashboard":
@@ -77,13 +93,14 @@ elif menu == "📋 Dashboard":
         st.stop()
 
     st.header("My Dashboard")
-    bookings = get_user_bookings(st.session_state.user_id)
+    uid = st.session_state.user_id
+    data = Loader(bookings=lambda: get_user_bookings(uid), support=lambda: get_user_support(uid))
+    data.load("bookings", "support")  # both queries at once
     st.subheader("My Bookings")
-    st.dataframe(bookings)
+    st.dataframe(data.bookings)
 
     st.subheader("Support History")
-    support = get_user_support(st.session_state.user_id)
-    st.dataframe(support)
+    st.dataframe(data.support)
 
 # Support
 elif menu == "🆘 Support":
@@ -94,20 +111,23 @@ elif menu == "🆘 Support":
     st.header("Submit a Support Request")
     issue = st.text_area("Describe your issue")
     if st.button("Submit Request"):
-        create_support_request(st.session_state.user_id, issue)
-        log_activity(st.session_state.user_id, "Submitted support request")
+        with transaction():
+            create_support_request(st.session_state.user_id, issue)
+            log_activity(st.session_state.user_id, "Submitted support request")
         st.success("Support request submitted.")
 
 # Admin Panel
 elif menu == "⚙️ Admin":
     st.title("Admin Panel")
 
-    tab1, tab2, tab3 = st.tabs(["Manage Packages", "Bookings", "Support"])
+    # only the selected section runs, loading just the data it declares
+    data = Loader(packages=get_all_packages, package_ids=package_ids)
+    section = sections("adm", {"Manage Packages": ["packages"], "Bookings": ["package_ids"],
+                               "Support": [], "Search": [], "Reports": [], "Performance": []}, data)
 
-    with tab1:
+    if section == "Manage Packages":
         st.subheader("All Packages")
-        packages = get_all_packages()
-        st.dataframe(packages)
+        st.dataframe(data.packages)
 
         st.subheader("Add Package")
         with st.form("new_package"):
@@ -121,29 +141,28 @@ elif menu == "⚙️ Admin":
                 add_package(name, price, hotel, duration, transport)
                 st.success("Package added.")
 
-    with tab2:
+    elif section == "Bookings":
         st.subheader("Manage Bookings")
-        bookings = get_all_bookings()
-        for _, row in bookings.iterrows():
-            st.markdown(f"### Booking #{row['id']}: {row['package_name']} for {row['user_name']}")
-            st.write(f"Status: {row['status']}, Travel Date: {row['travel_date']}, Payment: {row['payment_method']}")
-            new_status = st.selectbox(f"Update Status for #{row['id']}", ["Pending", "Confirmed", "Cancelled"], index=["Pending", "Confirmed", "Cancelled"].index(row['status']), key=f"status_{row['id']}")
-            if st.button(f"Save #{row['id']}"):
-                update_booking_status(row['id'], new_status)
-                log_activity(st.session_state.user_id, f"Updated booking {row['id']} to {new_status}")
-                st.success(f"Booking {row['id']} updated.")
-
-    with tab3:
+        filters = filter_bar("adm_bookings", statuses=BOOKING_STATUSES, packages=data.package_ids)
+        bookings = paged("adm_bookings", get_bookings_page, **filters)
+        status_grid("adm_bookings", bookings, "bookings", "booking", BOOKING_STATUSES,
+                    st.session_state.user_id)
+
+    elif section == "Support":
         st.subheader("Support Tickets")
-        tickets = get_all_support()
-        for _, t in tickets.iterrows():
-            st.markdown(f"#### Ticket #{t['id']} - From User {t['user_id']}")
-            st.write(f"Issue: {t['issue']}")
-            st.write(f"Status: {t['status']}")
-            new_status = st.selectbox(f"Set Status #{t['id']}", ["Pending", "Resolved"], index=["Pending", "Resolved"].index(t['status']), key=f"support_{t['id']}")
-            if st.button(f"Update Ticket #{t['id']}"):
-                update_support_status(t['id'], new_status)
-                st.success("Status updated.")
+        filters = filter_bar("adm_support", statuses=SUPPORT_STATUSES)
+        tickets = paged("adm_support", get_support_page, **filters)
+        status_grid("adm_support", tickets, "support_requests", "ticket", SUPPORT_STATUSES,
+                    st.session_state.user_id)
+
+    elif section == "Search":
+        search_panel("adm_search")
+
+    elif section == "Reports":
+        reports_panel()
+
+    else:
+        performance_panel()
 
 st.markdown("---")
 st.markdown("© 2025 Umrah Travel Agency | All Rights Reserved")